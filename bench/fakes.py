@@ -0,0 +1,297 @@
+"""
+Just enough of discord.py's runtime objects (guilds, channels, messages, interactions,
+voice clients) for the Music cog and the views to run without a gateway, plus a fake
+yt-dlp extractor pool and a fake ffprobe.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import urllib.request
+from urllib.parse import urlparse, parse_qs
+
+import discord
+
+from bench.synthetic import opus_file
+from utils.ogg_source import build_seek_index
+
+_ids = itertools.count(10**17)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content, self.embed, self.view = content, embed, view
+        self.author = channel.guild.me
+
+    async def edit(self, *, content=None, embed=None, view=None, **_):
+        if content is not None: self.content = content
+        if embed is not None: self.embed = embed
+        if view is not None: self.view = view
+        self.channel.edits += 1
+        return self
+
+    async def delete(self, **_):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, guild, name="music"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, *, embed=None, view=None, **_):
+        self.sent += 1
+        return FakeMessage(self, content, embed, view)
+
+    async def purge(self, **_):
+        return []
+
+
+class FakeVoiceClient:
+    """
+    Plays a source on a thread like discord.py's AudioPlayer, `speed` times faster than
+    real time (read() is called per 20ms frame; sleeps are batched per second of audio).
+    """
+
+    def __init__(self, channel, speed=200):
+        self.channel = channel
+        self.guild = channel.guild
+        self.speed = speed
+        self._source = None
+        self._playing = self._paused = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._connected = True
+        self.packets = 0
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, value):
+        self._source = value
+
+    def play(self, source, *, after=None):
+        if not self._connected:
+            raise discord.ClientException("Not connected to voice.")
+        self._source = source
+        self._stop.clear()
+        self._playing, self._paused = True, False
+        self._thread = threading.Thread(target=self._run, args=(after,), daemon=True)
+        self._thread.start()
+
+    def _run(self, after):
+        error = None
+        try:
+            while not self._stop.is_set():
+                if self._paused:
+                    time.sleep(0.01)
+                    continue
+                if not self._source.read():
+                    break
+                self.packets += 1
+                if self.packets % 50 == 0:
+                    time.sleep(1 / self.speed)
+        except Exception as e:
+            error = e
+        finally:
+            self._playing = False
+            try:
+                self._source.cleanup()
+            except Exception:
+                pass
+            if after: after(error)
+
+    def is_playing(self):
+        return self._playing and not self._paused
+
+    def is_paused(self):
+        return self._playing and self._paused
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._stop.set()
+
+    def is_connected(self):
+        return self._connected
+
+    async def disconnect(self, force=False):
+        self._connected = False
+        self.stop()
+        self.guild.voice_client = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, speed):
+        self.id = next(_ids)
+        self.guild = guild
+        self.speed = speed
+        self.members = []
+
+    async def connect(self, **_):
+        self.guild.voice_client = FakeVoiceClient(self, self.speed)
+        return self.guild.voice_client
+
+
+class FakeUser:
+    def __init__(self, voice_channel=None, bot=False):
+        self.id = next(_ids)
+        self.bot = bot
+        self.name = f"user{self.id % 1000}"
+        self.voice = type("VoiceState", (), {'channel': voice_channel})() if voice_channel else None
+
+
+class FakeGuild:
+    def __init__(self, speed=200):
+        self.id = next(_ids)
+        self.name = f"guild-{self.id % 10000}"
+        self.voice_client = None
+        self.me = FakeUser(bot=True)
+        self.text_channel = FakeTextChannel(self)
+        self.voice_channel = FakeVoiceChannel(self, speed)
+        self.text_channels = [self.text_channel]
+
+    def get_channel(self, channel_id):
+        for channel in (self.text_channel, self.voice_channel):
+            if channel.id == channel_id: return channel
+        return None
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **_):
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.interaction.original = await self.interaction.channel.send(content, **kwargs)
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        if self.interaction.message: await self.interaction.message.edit(**kwargs)
+
+    async def send_modal(self, modal):
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, message=None):
+        self.guild = guild
+        self.user = user
+        self.channel = guild.text_channel
+        self.message = message
+        self.original = message
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self.channel)
+
+    async def original_response(self):
+        return self.original
+
+    async def edit_original_response(self, **kwargs):
+        if self.original: await self.original.edit(**kwargs)
+        return self.original
+
+    async def delete_original_response(self):
+        pass
+
+
+class FakeContext:
+    """Duck-typed commands.Context, as built from an interaction."""
+
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+def video_id_of(url):
+    parsed = urlparse(url)
+    return parse_qs(parsed.query).get("v", [parsed.path.strip("/")[-11:]])[0]
+
+
+class FakeExtractorPool:
+    """
+    Stands in for ExtractorPool: answers after `latency` seconds, and 'downloads' by
+    writing a synthetic Opus file where yt-dlp's FFmpegExtractAudio would have put it.
+    With `stream_base` (an HTTP server serving '<video id>.opus'), stream lookups return
+    that file's URL and downloads fetch it from there, like yt-dlp would from YouTube.
+    """
+
+    def __init__(self, singles_tmpl, latency=0.2, seconds=180, packet_bytes=16, stream_base=None):
+        self.singles_tmpl = singles_tmpl
+        self.latency = latency
+        self.body = opus_file(seconds, packet_bytes)
+        self.stream_base = stream_base
+        self.calls = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    async def extract(self, profile, url, download=False, outtmpl=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        vid = video_id_of(url)
+        stream_url = f"{self.stream_base}/{vid}.opus" if self.stream_base else url
+        info = {'id': vid, 'title': f"Remote Song {vid}", 'webpage_url': url,
+                'url': stream_url, 'duration': 180, 'acodec': 'opus', 'abr': 128}
+        if not download:
+            return info, None
+        filename = (outtmpl or self.singles_tmpl) % {'title': info['title'], 'id': vid, 'ext': 'webm'}
+        await asyncio.to_thread(self._write, os.path.splitext(filename)[0] + ".opus",
+                                stream_url if self.stream_base else None)
+        return info, filename
+
+    def _write(self, path, url=None):
+        body = self.body
+        if url:
+            with urllib.request.urlopen(url) as response:
+                body = response.read()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+
+
+async def fake_probe(path):
+    """MetadataService.probe without ffprobe: reads the duration from the Ogg page granules."""
+    granules, _ = await asyncio.to_thread(build_seek_index, path)
+    duration = (granules[-1] - 312) / 48000 if granules else 0
+    return {'duration': duration, 'codec': 'opus', 'sample_rate': 48000, 'channels': 2, 'bitrate': 128}
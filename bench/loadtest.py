@@ -0,0 +1,255 @@
+"""
+Offline load test: synthetic library + fake Discord + fake yt-dlp, no network.
+
+    python -m bench.loadtest --guilds 50 --ops 40 --folders 40 --files 5000
+
+Replays random traffic per guild (local searches, YouTube links, folder plays, skips,
+shuffles, queue and library browsing) against the real Music cog and views, then prints
+throughput, p50/p99 latency per command and peak memory.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import config
+
+COMMANDS = {  # name -> weight in the traffic mix
+    'search_local': 30,
+    'youtube_link': 10,
+    'play_folder': 5,
+    'skip': 15,
+    'shuffle': 5,
+    'show_queue': 10,
+    'browse_library': 20,
+    'seek': 5,
+}
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def configure(workdir):
+    """Points every path the bot writes to at the scratch directory. Must run before importing state."""
+    config.MUSIC_FOLDER = os.path.join(workdir, "Library")
+    config.SINGLES_FOLDER = os.path.join(config.MUSIC_FOLDER, "Singles")
+    config.INDEX_DB = os.path.join(workdir, "library_index.db")
+    config.QUEUE_JOURNAL = os.path.join(workdir, "queue_journal.jsonl")
+    config.LOOKUP_CACHE_FILE = None
+    config.PERF_EXPORT_FILE = None
+    config.STREAM_ON_MISS = False  # streaming needs ffmpeg (see bench/stream_on_miss.py); plain downloads here
+    config.RESUME_PLAYBACK = False
+    config.YDL_OPTIONS = dict(config.YDL_OPTIONS, outtmpl=os.path.join(config.SINGLES_FOLDER, '%(title)s [%(id)s].%(ext)s'))
+
+
+class LoadTest:
+    def __init__(self, args, tracks):
+        self.args = args
+        self.tracks = tracks
+        self.rng = random.Random(args.seed)
+        self.latencies = {name: [] for name in COMMANDS}
+        self.errors = {}
+
+    async def setup(self):
+        import discord
+        from discord.ext import commands
+        import state
+        from bench import fakes
+
+        intents = discord.Intents.default()
+        self.bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+        await self.bot.__aenter__()  # sets up the loop-bound internals without logging in
+
+        t0 = time.perf_counter()
+        await self.bot.load_extension("cogs.music")
+        self.cog = self.bot.get_cog("Music")
+        self.cog.extractors.stop()
+        fake = fakes.FakeExtractorPool(config.YDL_OPTIONS['outtmpl'], latency=self.args.extract_latency,
+                                       packet_bytes=self.args.packet_bytes)
+        self.cog.extractors = self.cog.downloads.extractors = fake
+        self.cog.metadata.probe = fakes.fake_probe
+        await self.cog.sync_index()
+        self.index_seconds = time.perf_counter() - t0
+
+        self.state = state
+        self.fakes = fakes
+        self.folders = state.CACHED_SONG_INDEX.top_folders()
+        self.guilds = [fakes.FakeGuild(speed=self.args.speed) for _ in range(self.args.guilds)]
+        for guild in self.guilds:
+            user = fakes.FakeUser(guild.voice_channel)
+            guild.voice_channel.members.append(user)
+            guild.users = [user]
+            player = state.get_player(guild.id)
+            player.msg = await guild.text_channel.send("idle")
+
+    async def teardown(self):
+        # Stop playback and let the song-end callbacks run before the bot's loop goes away
+        threads = []
+        for guild in self.guilds:
+            self.state.get_player(guild.id).queue.clear()
+            vc = guild.voice_client
+            if vc:
+                threads.append(vc._thread)
+                await vc.disconnect()
+        for thread in threads:
+            if thread: await asyncio.to_thread(thread.join)
+        await asyncio.sleep(0.1)
+        await self.bot.unload_extension("cogs.music")
+        await self.bot.close()
+
+    # --- Commands (each mirrors what a real interaction would trigger) ---
+    async def search_local(self, guild, user):
+        _, title, _ = self.rng.choice(self.tracks)
+        await self.play(guild, user, title)
+
+    async def youtube_link(self, guild, user):
+        from bench.synthetic import video_id
+        await self.play(guild, user, f"https://www.youtube.com/watch?v={video_id(self.rng)}")
+
+    async def play_folder(self, guild, user):
+        await self.play(guild, user, self.rng.choice(self.folders))
+
+    async def play(self, guild, user, query):
+        from utils import perf
+        perf.begin(guild.id)
+        interaction = self.fakes.FakeInteraction(guild, user)
+        await interaction.response.defer(ephemeral=True)
+        await self.cog.smart_play(self.fakes.FakeContext(guild, user), query, interaction)
+
+    async def skip(self, guild, user):
+        await self.control(guild, user, 'skip_btn')
+
+    async def shuffle(self, guild, user):
+        await self.control(guild, user, 'shuffle_btn')
+
+    async def show_queue(self, guild, user):
+        await self.control(guild, user, 'show_queue_btn')
+
+    async def control(self, guild, user, button):
+        from ui.views import PlayerControlView
+        view = PlayerControlView(self.cog)
+        msg = self.state.get_player(guild.id).msg
+        await getattr(view, button).callback(self.fakes.FakeInteraction(guild, user, msg))
+
+    async def seek(self, guild, user):
+        await self.cog.seek(guild.voice_client, self.rng.choice((-60, 60)))
+
+    async def browse_library(self, guild, user):
+        from ui.views import LibraryGrid
+        interaction = self.fakes.FakeInteraction(guild, user)
+        grid = LibraryGrid(user.id, interaction, self.cog)
+        grid.get_embed()
+        folder = LibraryGrid(user.id, interaction, self.cog, folder=self.rng.choice(self.folders))
+        folder.get_embed()
+        for _ in range(self.rng.randint(0, 3)):
+            if len(folder.files) > (folder.page + 1) * 20:
+                folder.page += 1
+                folder.create_interface()
+                folder.get_embed()
+
+    # --- Driver ---
+    async def guild_session(self, guild):
+        names, weights = zip(*COMMANDS.items())
+        user = guild.users[0]
+        for _ in range(self.args.ops):
+            name = self.rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                await getattr(self, name)(guild, user)
+            except Exception as e:
+                key = f"{name}: {type(e).__name__}: {e}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+                continue
+            self.latencies[name].append(time.perf_counter() - t0)
+            await asyncio.sleep(self.rng.uniform(0, self.args.think))
+
+    async def run(self):
+        await self.setup()
+        if self.args.tracemalloc: tracemalloc.start()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(self.guild_session(g) for g in self.guilds))
+        self.wall = time.perf_counter() - t0
+        self.peak_traced = tracemalloc.get_traced_memory()[1] if self.args.tracemalloc else None
+        if self.args.tracemalloc: tracemalloc.stop()
+        await self.teardown()
+
+    def report(self):
+        from utils import perf
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"\nLibrary: {len(self.tracks)} files in {len(self.folders)} folders, "
+              f"indexed in {self.index_seconds * 1000:.0f} ms")
+        print(f"Traffic: {self.args.guilds} guilds x {self.args.ops} ops = {total} commands in {self.wall:.2f}s "
+              f"({total / self.wall:.1f} commands/s)\n")
+        print(f"{'command':<16}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, values in self.latencies.items():
+            if not values: continue
+            print(f"{name:<16}{len(values):>6}{percentile(values, 0.5) * 1000:>10.1f}"
+                  f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+
+        print("\nInteraction -> stage (all guilds)")
+        for stage in perf.STAGES:
+            hists = [h for _, h in perf.REGISTRY.select('stage', stage=stage)]
+            if hists:
+                hist = perf.Histogram.merge(hists)
+                print(f"  {stage:<14} p50 <= {hist.quantile(0.5) * 1000:.0f} ms, p99 <= {hist.quantile(0.99) * 1000:.0f} ms (n={hist.count})")
+        lag = perf.REGISTRY.select('loop_lag')
+        if lag:
+            hist = lag[0][1]
+            print(f"  {'loop lag':<14} p99 <= {hist.quantile(0.99) * 1000:.0f} ms, max {hist.max * 1000:.0f} ms")
+
+        print()
+        if self.peak_traced is not None:
+            print(f"Peak traced Python memory: {self.peak_traced / 2**20:.1f} MiB")
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"Peak RSS: {rss / (2**20 if sys.platform == 'darwin' else 2**10):.1f} MiB")
+        except ImportError:
+            pass # Windows
+        if self.errors:
+            print("\nErrors:")
+            for key, count in sorted(self.errors.items(), key=lambda x: -x[1]):
+                print(f"  {count:>4} x {key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=30, help="commands per guild")
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--packet-bytes", type=int, default=16, help="Opus packet size, sets the file size")
+    parser.add_argument("--speed", type=float, default=200, help="playback speed-up of the fake voice clients")
+    parser.add_argument("--extract-latency", type=float, default=0.2, help="seconds per fake yt-dlp call")
+    parser.add_argument("--think", type=float, default=0.05, help="max pause between a guild's commands")
+    parser.add_argument("--tracemalloc", action="store_true", help="measure peak Python memory (slower)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", help="build/keep the library in this directory instead of a temp one")
+    args = parser.parse_args()
+
+    workdir = args.keep or tempfile.mkdtemp(prefix="jukebox-bench-")
+    configure(workdir)
+    from bench.synthetic import build_library
+    t0 = time.perf_counter()
+    tracks = build_library(config.MUSIC_FOLDER, args.folders, args.files,
+                           packet_bytes=args.packet_bytes, seed=args.seed)
+    print(f"Synthetic library built in {time.perf_counter() - t0:.1f}s at {workdir}")
+
+    test = LoadTest(args, tracks)
+    try:
+        asyncio.run(test.run())
+        test.report()
+    finally:
+        if not args.keep: shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Offline check of the stream-on-miss path (config.STREAM_ON_MISS) against a local HTTP server:
+
+    python -m bench.stream_on_miss
+
+A synthetic Ogg/Opus file is served with http.server and the fake extractor points the
+YouTube lookups and downloads at it. Drives download_single (stream + background save),
+prepare and open_stream on the real Music cog, then checks that the same queue item plays
+from the library once the save has landed. open_stream needs ffmpeg (config.FFMPEG_EXE or
+'ffmpeg' on PATH); without it that step is reported as skipped.
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import config
+from bench.loadtest import LoadTest, configure
+from bench.synthetic import opus_file
+
+VIDEO_ID = "StreamTest1"
+
+
+class CountingHandler(http.server.SimpleHTTPRequestHandler):
+    requests = {}  # path -> GET count
+
+    def do_GET(self):
+        CountingHandler.requests[self.path] = CountingHandler.requests.get(self.path, 0) + 1
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory):
+    """Serves `directory` on a free localhost port from a thread. Returns (server, base URL)."""
+    handler = functools.partial(CountingHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class StreamCheck:
+    def __init__(self, args, base, body):
+        self.args = args
+        self.base = base
+        self.body = body
+        self.failures = 0
+
+    def check(self, ok, what):
+        print(f"  {'ok  ' if ok else 'FAIL'} {what}")
+        if not ok: self.failures += 1
+
+    async def read_packets(self, source, n=50):
+        """Reads up to n packets off the source like the voice thread would. Returns how many came."""
+        def read():
+            got = 0
+            while got < n and source.read():
+                got += 1
+            return got
+        try:
+            return await asyncio.to_thread(read)
+        finally:
+            source.cleanup()
+
+    async def run(self):
+        test = LoadTest(self.args, [])
+        await test.setup()
+        cog = test.cog
+        cog.extractors.stream_base = self.base
+        index = test.state.CACHED_SONG_INDEX
+        guild = test.guilds[0]
+        ctx = test.fakes.FakeContext(guild, guild.users[0])
+        stream_url = f"{self.base}/{VIDEO_ID}.opus"
+        try:
+            print("download_single (library miss)")
+            path, _ = await cog.download_single(ctx, f"https://www.youtube.com/watch?v={VIDEO_ID}", "Stream Test", VIDEO_ID)
+            self.check(path == stream_url, f"queued the stream URL ({path})")
+            self.check(path in cog.streams, "stream metadata remembered")
+            self.check(index.get_by_id(VIDEO_ID) is None, "not in the library yet (saving in the background)")
+
+            print("prepare -> open_stream")
+            ffmpeg = shutil.which(config.FFMPEG_EXE) or shutil.which("ffmpeg")
+            if ffmpeg:
+                config.FFMPEG_EXE = ffmpeg
+                played, source, meta = await cog.prepare(path)
+                self.check(played == stream_url, "plays from the HTTP server")
+                self.check(type(source).__name__ == "FFmpegOpusAudio", f"ffmpeg source ({type(source).__name__})")
+                self.check(await self.read_packets(source) > 0, "packets read from the stream")
+            else:
+                print("  skip ffmpeg not found, open_stream not exercised")
+
+            print("background save")
+            deadline = time.monotonic() + 10
+            while index.get_by_id(VIDEO_ID) is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            entry = index.get_by_id(VIDEO_ID)
+            self.check(entry is not None, "saved file registered in the index")
+            if entry:
+                with open(entry['path'], "rb") as f:
+                    self.check(f.read() == self.body, f"file matches what was served ({os.path.relpath(entry['path'], config.MUSIC_FOLDER)})")
+            self.check(CountingHandler.requests.get(f"/{VIDEO_ID}.opus", 0) >= 1, "download fetched it from the server")
+
+            print("prepare after the save")
+            played, source, meta = await cog.prepare(path)
+            self.check(entry is not None and played == entry['path'], "same queue item now plays the library file")
+            self.check(type(source).__name__ == "OggOpusSource", f"passthrough source ({type(source).__name__})")
+            self.check(await self.read_packets(source) > 0, "packets read from the file")
+        finally:
+            await test.teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extract-latency", type=float, default=0.5, help="seconds per fake yt-dlp call")
+    args = parser.parse_args()
+    # What LoadTest.setup reads: one guild, default fakes
+    args.guilds, args.packet_bytes, args.speed, args.seed = 1, 16, 200, 1
+
+    workdir = tempfile.mkdtemp(prefix="jukebox-stream-")
+    configure(workdir)
+    config.STREAM_ON_MISS = True
+    served = os.path.join(workdir, "served")
+    os.makedirs(served)
+    body = opus_file(60)
+    with open(os.path.join(served, f"{VIDEO_ID}.opus"), "wb") as f:
+        f.write(body)
+    server, base = serve(served)
+
+    check = StreamCheck(args, base, body)
+    try:
+        asyncio.run(check.run())
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("\nAll checks passed" if not check.failures else f"\n{check.failures} check(s) failed")
+    sys.exit(1 if check.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import random
+import string
+import struct
+
+# Ogg pages carry a CRC-32 with polynomial 0x04C11DB7, no reflection (not zlib's)
+_CRC_TABLE = []
+for _i in range(256):
+    _r = _i << 24
+    for _ in range(8):
+        _r = ((_r << 1) ^ 0x04C11DB7) if _r & 0x80000000 else _r << 1
+    _CRC_TABLE.append(_r & 0xFFFFFFFF)
+
+WORDS = ("moon", "river", "dragon", "tavern", "storm", "night", "fire", "song", "road", "king",
+         "shadow", "forest", "battle", "dawn", "halfling", "bard", "ghost", "winter", "sea", "ember")
+
+
+def ogg_crc(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+def ogg_page(packets, granule, seq, header_type=0, serial=0x4A4B):
+    table, body = bytearray(), bytearray()
+    for packet in packets:
+        n = len(packet)
+        table += b"\xff" * (n // 255) + bytes([n % 255])
+        body += packet
+    header = struct.pack("<4sBBqIIIB", b"OggS", 0, header_type, granule, serial, seq, 0, len(table))
+    page = bytearray(header + table + body)
+    struct.pack_into("<I", page, 22, ogg_crc(page))
+    return bytes(page)
+
+
+def opus_file(seconds, packet_bytes=16, packets_per_page=50):
+    """
+    A valid 48 kHz stereo Ogg/Opus file of `seconds` of 20ms frames (TOC config 31, filler payload):
+    enough for OggOpusSource, seeking and anything that only looks at the container.
+    """
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 5) + b"bench" + struct.pack("<I", 0)
+    out = [ogg_page([head], 0, 0, header_type=0x02), ogg_page([tags], 0, 1)]
+    frame = bytes([0xFC]) + bytes(packet_bytes - 1)  # config 31, stereo, one 20ms frame
+    total = max(int(seconds * 50), 1)
+    seq, granule = 2, 312
+    for start in range(0, total, packets_per_page):
+        n = min(packets_per_page, total - start)
+        granule += 960 * n
+        last = start + n >= total
+        out.append(ogg_page([frame] * n, granule, seq, header_type=0x04 if last else 0))
+        seq += 1
+    return b"".join(out)
+
+
+def random_title(rng):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+
+
+def video_id(rng):
+    return "".join(rng.choice(string.ascii_letters + string.digits + "-_") for _ in range(11))
+
+
+def build_library(root, folders=20, files=500, seconds=(60, 300), packet_bytes=16, seed=1):
+    """
+    Creates `folders` playlist folders plus Singles under `root`, `files` tracks in total,
+    named like yt-dlp does ('title [id].opus'). `packet_bytes` sets the file size
+    (~2.9 MB per minute per 1000 bytes). Files of the same length share one encoded
+    body. Returns [(path, title, seconds)].
+    """
+    rng = random.Random(seed)
+    names = ["Singles"] + [f"{random_title(rng)} {i}" for i in range(folders)]
+    for name in names:
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    bodies, tracks = {}, []
+    for i in range(files):
+        length = rng.randint(*seconds) // 10 * 10
+        body = bodies.get(length)
+        if body is None:
+            body = bodies[length] = opus_file(length, packet_bytes)
+        title = f"{random_title(rng)} {i}"
+        path = os.path.join(root, rng.choice(names), f"{title} [{video_id(rng)}].opus")
+        with open(path, "wb") as f:
+            f.write(body)
+        tracks.append((path, title, length))
+    return tracks
+
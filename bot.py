@@ -4,24 +4,46 @@ import asyncio
 import config
 import state
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
 
-@bot.command()
-async def reload(ctx):
-    """Reloads the music cog to apply code changes without restarting."""
-    try:
-        await bot.reload_extension("cogs.music")
-        await ctx.send("✅ **Music Cog Reloaded!** Updates are live.")
-    except Exception as e:
-        await ctx.send(f"❌ Error reloading: {e}")
+def make_bot(shard_ids=None, shard_count=None):
+    """A plain Bot, or (from launcher.py) an AutoShardedBot running `shard_ids` out of `shard_count`."""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    if shard_count:
+        bot = commands.AutoShardedBot(command_prefix="!", intents=intents, help_command=None,
+                                      shard_ids=shard_ids, shard_count=shard_count)
+    else:
+        bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+
+    @bot.command()
+    async def reload(ctx):
+        """Reloads the music cog to apply code changes without restarting."""
+        try:
+            await bot.reload_extension("cogs.music")
+            await ctx.send("✅ **Music Cog Reloaded!** Updates are live.")
+        except Exception as e:
+            await ctx.send(f"❌ Error reloading: {e}")
 
-async def main():
+    async def setup_hook():
+        # Registers the slash commands (/play) with Discord once we are logged in
+        # (commands are global, so only the process running shard 0 does it)
+        if not shard_ids or 0 in shard_ids:
+            await bot.tree.sync()
+    bot.setup_hook = setup_hook
+
+    # We hook our teardown into the bot's close sequence
+    original_close = bot.close
+    async def patched_close():
+        await teardown()         # Run our cleanup first
+        await original_close()   # Then actually shut down
+    bot.close = patched_close
+    return bot
+
+async def main(bot):
     async with bot:
         # Load extensions (cogs)
         await bot.load_extension("cogs.music")
-        
+
         # Run the bot
         if config.TOKEN:
             await bot.start(config.TOKEN)
@@ -30,24 +52,18 @@ async def main():
 
 async def teardown():
     print("\n[Teardown] Bot is closing. Performing final cleanup...")
-    if state.STATE.msg:
+    for player in state.PLAYERS.values():
+        if not player.msg: continue
         try:
             # The bot is still connected to Discord here!
-            await state.STATE.msg.delete()
-            print("[Teardown] Player UI deleted successfully.")
+            await player.msg.delete()
+            print(f"[Teardown] Player UI deleted for guild {player.gid}.")
         except Exception as e:
             print(f"[Teardown] Cleanup failed: {e}")
 
-# We hook our teardown into the bot's close sequence
-original_close = bot.close
-async def patched_close():
-    await teardown()         # Run our cleanup first
-    await original_close()   # Then actually shut down
-bot.close = patched_close  
-
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(make_bot()))
     except KeyboardInterrupt:
         # asyncio.run handles loop cleanup
         pass
@@ -1,112 +1,301 @@
 import os
-import glob
 import time
-import random
 import asyncio
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
-from collections import deque
-from rapidfuzz import fuzz
+from collections import OrderedDict
 import yt_dlp
 
 import config
 import state
-from state import STATE as plstate
-from utils.helpers import (log_error, get_duration, get_progress_bar, 
+from utils import perf
+from utils.coordinator import RemoteDownloads
+from utils.downloads import DownloadScheduler, INTERACTIVE, BULK, resolve_stream
+from utils.extractors import ExtractorPool
+from utils.importer import Importer
+from utils.lookup_cache import LookupCache, search_key, link_key
+from utils.helpers import (log_error, get_progress_bar, 
                            format_time, delete_after_delay)
+from utils.metadata import MetadataService
+from utils.ogg_source import OggOpusSource, NotPassthrough
+from utils.queue_journal import QueueJournal
+from utils.playlist_manifest import PlaylistManifest, DONE, FAILED
+from utils.search import SearchEngine
+from utils.singles_cache import SinglesCache
+from utils.track_queue import Track
 from ui.views import PlayerControlView, PlaylistSelectView, YouTubeSelectionView
+from ui.updater import PlayerUpdater
 
+# Start preparing the next song this many seconds before the current one ends
+PREFETCH_LEAD = 5
+# Resolved stream URLs remembered for queued/playing songs
+MAX_STREAMS = 500
+# Keeps ffmpeg reading a remote stream through network hiccups
+STREAM_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+# The progress field moves in steps this long, so the 5s ticks in between render
+# the same embed and the updater sends nothing
+PROGRESS_STEP = 30
 
 
 class Music(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        self.search_engine = SearchEngine(state.CACHED_SONG_INDEX)
+        self.metadata = MetadataService(state.CACHED_SONG_INDEX)
+        self.updater = PlayerUpdater(self.render_player)
+        self.updater.start()
+        # Warm yt-dlp instances in worker processes (when sharded the coordinator has the download ones)
+        self.extractors = ExtractorPool(workers=0 if config.COORDINATOR else 3)
+        self.extractors.start()
+        if config.COORDINATOR: # sharded (launcher.py): one process downloads for every shard
+            self.downloads = RemoteDownloads(*config.COORDINATOR, state.CACHED_SONG_INDEX)
+        else:
+            self.downloads = DownloadScheduler(self.extractors)
+        self.lookups = LookupCache(config.LOOKUP_CACHE_SIZE, config.LOOKUP_CACHE_FILE)
+        self.downloads.start()
+        self.singles = SinglesCache(state.CACHED_SONG_INDEX, config.SINGLES_FOLDER,
+                                    config.SINGLES_MAX_BYTES, config.SINGLES_MAX_FILES)
+        self.trimming = False
+        self.playlist_tasks = set()  # background playlist streams (kept referenced until done)
+        self.streams = OrderedDict() # direct stream URL -> meta, for songs playing before their download finished
+        self.journal = QueueJournal(config.QUEUE_JOURNAL)
+        self.lag_monitor = perf.LoopLagMonitor()
+        self.lag_monitor.start()
+        self.resume_pending = {}     # gid -> saved 'now playing' to continue once the bot is ready
         self.live_update.start()
+        self.save_lookups.start()
         
 
+    async def cog_load(self):
+        # The index is needed to map restored streams back to downloaded files.
+        # Loaded in a thread: nothing else uses it before this returns (!reload finds it already open)
+        await asyncio.to_thread(state.CACHED_SONG_INDEX.open_snapshot, config.INDEX_DB, readonly=bool(config.COORDINATOR))
+        asyncio.create_task(state.CACHED_SONG_INDEX.build_grams())
+        await self.restore_queues()
+        self.checkpoint.start()
+        if config.PERF_EXPORT_FILE: self.export_perf.start()
+        if self.bot.is_ready(): # !reload: no on_ready coming
+            asyncio.create_task(self.resume_playback())
+
     async def cog_unload(self):
         self.live_update.cancel()
+        self.save_lookups.cancel()
+        self.checkpoint.cancel()
+        self.export_perf.cancel()
+        self.lag_monitor.stop()
+        self.write_positions()
+        self.journal.close()
+        if self.lookups.dirty: self.lookups.save()
+        self.updater.stop()
+        self.downloads.stop()
+        self.extractors.stop()
+        for task in self.playlist_tasks: task.cancel()
+        for player in state.PLAYERS.values():
+            self.discard_prefetch(player, restart=False)
     
     
     @tasks.loop(seconds=5)
     async def live_update(self):
+        # Progress ticks only; the updater skips edits that wouldn't change anything
+        for player in list(state.PLAYERS.values()):
+            if player.msg and player.start_t > 0 and not player.is_paused:
+                self.updater.request(player, urgent=False)
+
+    def render_player(self, player):
+        """Builds the 'Now Playing' embed, or None when there is nothing playing to show."""
+        if player.start_t <= 0:
+            return None
+        # 1. Calculate Progress
+        elapsed = player.elapsed()
         
-        if plstate.msg and plstate.start_t > 0:
-            # 1. Calculate Progress
-            elapsed = (
-                (plstate.pause_start - plstate.start_t) 
-                if plstate.is_paused 
-                else (time.time() - plstate.start_t)
-                )
-            
-            # if the song is over, stop updating so the 'Idle' embed can stay
-            if elapsed > plstate.duration + 2: # +2 seconds buffer
-                return
-            
-            bar = get_progress_bar(elapsed, plstate.duration)
-            ts = (f"`{format_time(elapsed)}"
-                  f"{bar}"
-                  f"{format_time(plstate.duration)}`")
-            
-            # 2. Get "Up Next" Info
-            try:
-                gid = str(plstate.msg.guild.id)
-                if gid in state.SONG_QUEUES and len(state.SONG_QUEUES[gid]) > 0:
-                    # Look at the first item in the queue without removing it
-                    next_song_title = state.SONG_QUEUES[gid][0][1]
-                    up_next_text = f"⏭️ **{next_song_title}**"
-                else:
-                    up_next_text = "Empty (Add more with !play)"
-
-                # 3. Build Embed
-                embed = discord.Embed(
-                    title="Now Playing", 
-                    description=f"**{plstate.title}**", color=0x3498db)
-                embed.add_field(name="Progress", value=ts, inline=False)
-                embed.add_field(name="Up Next", value=up_next_text, inline=False)
-                
-                await plstate.msg.edit(embed=embed)
-            except Exception:
-                 # Message might be deleted or guild unavailable
-                pass
+        # if the song is over, stop updating so the 'Idle' embed can stay
+        if elapsed > player.duration + 2: # +2 seconds buffer
+            return None
+        
+        shown = elapsed - elapsed % PROGRESS_STEP
+        bar = get_progress_bar(shown, player.duration)
+        ts = (f"`{format_time(shown)}"
+              f"{bar}"
+              f"{format_time(player.duration)}`")
+        
+        # 2. Get "Up Next" Info
+        if player.queue:
+            # Look at the first item in the queue without removing it
+            next_song_title = player.queue[0].title
+            up_next_text = f"⏭️ **{next_song_title}**"
+        else:
+            up_next_text = "Empty (Add more with !play)"
+
+        # 3. Build Embed
+        embed = discord.Embed(
+            title="Now Playing", 
+            description=f"**{player.title}**", color=0x3498db)
+        embed.add_field(name="Progress", value=ts, inline=False)
+        embed.add_field(name="Up Next", value=up_next_text, inline=False)
+        return embed
 
     @live_update.before_loop
     async def before_live_update(self):
         await self.bot.wait_until_ready()
 
+    @tasks.loop(minutes=2)
+    async def save_lookups(self):
+        # Batched: one write for however many lookups were cached since the last tick
+        if self.lookups.dirty:
+            await asyncio.to_thread(self.lookups.save, self.lookups.snapshot())
+
+    @tasks.loop(seconds=30)
+    async def checkpoint(self):
+        self.write_positions()
+        if self.journal.records > self.journal.compact_after:
+            await self.journal.compact(self.journal_snapshot())
+
+    @tasks.loop(seconds=15)
+    async def export_perf(self):
+        await asyncio.to_thread(perf.REGISTRY.export, config.PERF_EXPORT_FILE)
+
+    def write_positions(self):
+        for player in list(state.PLAYERS.values()):
+            if player.start_t > 0 and not player.is_paused:
+                self.journal.position(player.gid, player.elapsed())
+
+    def now_record(self, player):
+        """What the journal needs to resume this guild's current song, or None."""
+        if player.start_t <= 0 or not player.track:
+            return None
+        return {'t': player.track, 'pos': round(player.elapsed(), 1),
+                'vc': player.vc.channel.id if player.vc and player.vc.channel else None,
+                'tc': player.channel.id if player.channel else None}
+
+    def journal_snapshot(self):
+        return [QueueJournal.snapshot_record(p.gid, p.queue, self.now_record(p))
+                for p in list(state.PLAYERS.values())]
+
+    async def restore_queues(self):
+        """Rebuilds the queues saved in the journal, then starts a fresh log from them."""
+        saved = await asyncio.to_thread(self.journal.load)
+        for gid, guild in saved.items():
+            player = state.get_player(gid)
+            if player.queue or player.start_t > 0:
+                continue # Still in memory (!reload), that is newer than the log
+            tracks, now = guild['queue'], guild['now']
+            if now and now['t']:
+                tracks.insert(0, now['t']) # The interrupted song plays first
+                if config.RESUME_PLAYBACK and now['vc']: self.resume_pending[gid] = now
+            player.queue.extend(map(self.revive, tracks))
+        state.JOURNAL = self.journal
+        self.journal.open()
+        await self.journal.compact(self.journal_snapshot())
+        restored = sum(len(p.queue) for p in state.PLAYERS.values())
+        if restored: print(f"Restored {restored} queued songs from the journal")
+
+    def revive(self, track):
+        """Stream URLs die with the process: point restored streams back at the file, or the video page."""
+        if not track.path.startswith(("http://", "https://")) or not track.vid:
+            return track
+        local = state.CACHED_SONG_INDEX.get_by_id(track.vid)
+        if local:
+            return Track.from_entry(local)
+        return Track(f"https://www.youtube.com/watch?v={track.vid}", track.title, track.vid)
+
+    async def resume_playback(self):
+        """Rejoins voice and continues the songs that were playing before the restart."""
+        pending, self.resume_pending = self.resume_pending, {}
+        for gid, now in pending.items():
+            guild = self.bot.get_guild(int(gid))
+            voice = guild.get_channel(now['vc']) if guild else None
+            player = state.get_player(gid)
+            # Only if someone is still listening and nothing else started meanwhile
+            if not voice or guild.voice_client or not player.queue or not any(not m.bot for m in voice.members):
+                continue
+            text = guild.get_channel(now['tc']) if now['tc'] else None
+            text = text or (player.msg.channel if player.msg else None)
+            if not text:
+                continue
+            try:
+                vc = await voice.connect()
+                await self.play_next_song(vc, gid, text)
+                if now['pos'] > 5: await self.seek(vc, now['pos'])
+            except Exception as e:
+                print(f"Could not resume playback in {guild.name}: {e}")
+
+    async def lookup(self, query, is_link):
+        """Flat extract_info of a link or a 5-result search, served from the cache when we have it."""
+        key = link_key(query) if is_link else search_key(query)
+        info = self.lookups.get(key)
+        if info is None:
+            if is_link:
+                info, _ = await self.extractors.extract('playlist', query)
+            else:
+                info, _ = await self.extractors.extract('search', f"ytsearch5:{query}")
+            self.lookups.put(key, info, config.PLAYLIST_CACHE_TTL if is_link else config.SEARCH_CACHE_TTL)
+            info = self.lookups.get(key)
+        return info
+
+    def live(self):
+        """The Music cog loaded right now. Song-end callbacks started before a !reload must not keep using this one."""
+        return self.bot.get_cog("Music") or self
+
     async def play_next_song(self, vc, gid, channel):
-        if gid in state.SONG_QUEUES and state.SONG_QUEUES[gid]:
-            file_path, title = state.SONG_QUEUES[gid].popleft()
-            (plstate.title, plstate.duration, 
-             plstate.start_t, plstate.is_paused) = (
-                 title, get_duration(file_path), 
-                 time.time(), False)
-            
-            # Optimization: Use FFmpegOpusAudio to reduce CPU usage (avoids double transcoding)
+        player = state.get_player(gid)
+        player.vc = vc
+        player.channel = channel
+        while player.queue:
+            item = player.queue.popleft()
+            title = item.title
+            prefetched = self.take_prefetch(player, item)
+            if prefetched:
+                file_path, source, meta = prefetched
+                break
             try:
-                source = await discord.FFmpegOpusAudio.from_probe(file_path, executable=config.FFMPEG_EXE)
-            except Exception:
-                source = discord.FFmpegPCMAudio(file_path, executable=config.FFMPEG_EXE)
+                file_path, source, meta = await self.prepare(item.path)
+                break
+            except Exception as e:
+                # e.g. a restored video that was taken down: skip it rather than stall the queue
+                log_error(title, f"Playback: {e}")
+                try:
+                    await channel.send(f"⚠️ Skipped **{title}** (couldn't load it)", delete_after=5)
+                except discord.HTTPException:
+                    pass
+        else:
+            item = None
+
+        if item:
+            perf.mark('source')
+            perf.on_first_packet(source)
+            (player.title, player.path, player.duration, 
+             player.start_t, player.is_paused) = (
+                 title, file_path, meta['duration'], 
+                 time.time(), False)
+            state.CACHED_SONG_INDEX.touch(file_path)
+            player.track = item
+            self.journal.now_playing(gid, item, 0, vc.channel.id if vc.channel else None, channel.id)
 
             vc.play(source, 
                     after=lambda e: 
                     asyncio.run_coroutine_threadsafe(
-                        self.play_next_song(vc, gid, channel), self.bot.loop))
+                        self.live().play_next_song(vc, gid, channel), self.bot.loop))
+            player.prefetch_task = asyncio.create_task(self.prefetch_next(player))
             
             # PERMANENT PLAYER LOGIC:
-            embed = discord.Embed(title="Now Playing", description=f"**{title}**", color=0x3498db)
-            if plstate.msg:
+            embed = self.render_player(player)
+            if player.msg:
                 try:
-                    await plstate.msg.edit(embed=embed, 
+                    await player.msg.edit(embed=embed, 
                                               view=PlayerControlView(self))
                 except:
-                    plstate.msg = await channel.send(embed=embed, view=PlayerControlView(self))
+                    player.msg = await channel.send(embed=embed, view=PlayerControlView(self))
             else:
-                plstate.msg = await channel.send(embed=embed, view=PlayerControlView(self))
+                player.msg = await channel.send(embed=embed, view=PlayerControlView(self))
+            self.updater.mark_sent(player, embed)
         else:
-            plstate.start_t = 0 # CRITICAL: This tells the loop to stop updating
-            plstate.title = ""
+            player.start_t = 0 # CRITICAL: This tells the loop to stop updating
+            player.title = ""
+            player.path = None
+            player.track = None
+            self.journal.now_playing(gid, None)
             
             # Queue finished: Reset the player to Idle
             idle_embed = discord.Embed(
@@ -114,13 +303,160 @@ class Music(commands.Cog):
                 description="🎶 **Queue finished.**\nWaiting for new songs...",
                 color=discord.Color.blue()
             )
-            if plstate.msg:
+            if player.msg:
                 try:
-                    await plstate.msg.edit(embed=idle_embed, 
+                    await player.msg.edit(embed=idle_embed, 
                                               view=PlayerControlView(self))
+                    self.updater.mark_sent(player, idle_embed)
                 except:
                      pass
-            plstate.start_t = 0
+            player.start_t = 0
+
+    async def prepare(self, path):
+        """Opens a queue item's audio. Returns (path actually played, source, meta)."""
+        stream = self.streams.get(path)
+        if stream is None and path.startswith(("http://", "https://")):
+            # Restored from the journal: the old stream URL expired, resolve the video again
+            info = await resolve_stream(self.extractors, path)
+            path = self.remember_stream(info)
+            stream = self.streams[path]
+        if stream:
+            local = state.CACHED_SONG_INDEX.get_by_id(stream['id'])
+            if not local:
+                return path, self.open_stream(path, stream), stream
+            path = local['path'] # The background save finished in the meantime, play the file
+        # One cached probe gives both the duration and the codec (no ffprobe on the event loop)
+        meta = await self.metadata.get(path)
+        return path, await self.open_source(path, meta), meta
+
+    def open_stream(self, url, meta, start=0):
+        """FFmpeg source reading a remote audio stream (YouTube's direct URL, or any http file)."""
+        before = STREAM_BEFORE_OPTIONS + (f" -ss {start:.2f}" if start else "")
+        return discord.FFmpegOpusAudio(url, executable=config.FFMPEG_EXE, codec=meta['codec'],
+                                       bitrate=min(meta['bitrate'] or 128, 512), before_options=before)
+
+    def remember_stream(self, info):
+        """Stores what we know about a resolved stream; returns its URL (used as the queue item's path)."""
+        self.streams[info['url']] = {
+            'id': info.get('id'),
+            'duration': float(info.get('duration') or 0),
+            'codec': info.get('acodec'),
+            'sample_rate': info.get('asr'),
+            'channels': info.get('audio_channels'),
+            'bitrate': round(info.get('abr') or 0),
+        }
+        while len(self.streams) > MAX_STREAMS:
+            self.streams.popitem(last=False)
+        return info['url']
+
+    async def open_source(self, file_path, meta):
+        codec = meta['codec']
+        # Library files are already 48kHz Opus: send the packets as-is, no ffmpeg process at all
+        if codec == 'opus':
+            opening = asyncio.ensure_future(asyncio.to_thread(OggOpusSource, file_path))
+            try:
+                return await asyncio.shield(opening)
+            except NotPassthrough:
+                codec = None # Opus Discord can't take as-is (frame size, layout): ffmpeg has to re-encode it
+            except OSError:
+                pass
+            except asyncio.CancelledError:
+                # e.g. a prefetch thrown away: the thread still opens the file, close it when it's done
+                opening.add_done_callback(lambda f: f.cancelled() or f.exception() or f.result().cleanup())
+                raise
+
+        # Optimization: Use FFmpegOpusAudio to reduce CPU usage (opus files are just copied, not transcoded)
+        try:
+            return discord.FFmpegOpusAudio(file_path, executable=config.FFMPEG_EXE, codec=codec,
+                                           bitrate=min(meta['bitrate'] or 128, 512))
+        except Exception:
+            return discord.FFmpegPCMAudio(file_path, executable=config.FFMPEG_EXE)
+
+    async def prefetch_next(self, player):
+        """Opens the head of the queue shortly before the current song ends, for a gapless handoff."""
+        # Re-check every few seconds so pauses and seeks move the deadline
+        while player.start_t > 0:
+            remaining = player.duration - player.elapsed()
+            if remaining <= PREFETCH_LEAD: break
+            await asyncio.sleep(min(remaining - PREFETCH_LEAD, 5))
+
+        queue = player.queue
+        if not queue or player.start_t == 0:
+            return
+        item = queue[0]
+        path, source, meta = await self.prepare(item.path)
+        try:
+            if isinstance(source, OggOpusSource):
+                await asyncio.to_thread(source.prime)
+        except asyncio.CancelledError:
+            source.cleanup()
+            raise
+
+        # The queue may have changed while we were opening the file
+        if queue and queue[0] is item and player.queue is queue:
+            player.prefetched = (item, path, source, meta)
+        else:
+            source.cleanup()
+
+    def take_prefetch(self, player, item):
+        """Returns (path, source, meta) if the prefetched song is the one about to play."""
+        task, player.prefetch_task = player.prefetch_task, None
+        if task and not task.done(): task.cancel()
+        prefetched, player.prefetched = player.prefetched, None
+        if not prefetched:
+            return None
+        if prefetched[0] is not item:
+            prefetched[2].cleanup()
+            return None
+        return prefetched[1:]
+
+    def discard_prefetch(self, player, restart=True):
+        """Throws away the prepared next song (queue reordered, shuffled or cleared)."""
+        task, player.prefetch_task = player.prefetch_task, None
+        if task and not task.done(): task.cancel()
+        prefetched, player.prefetched = player.prefetched, None
+        if prefetched: prefetched[2].cleanup()
+        # Still playing? Prepare whatever is at the head now
+        if restart and player.start_t > 0:
+            player.prefetch_task = asyncio.create_task(self.prefetch_next(player))
+
+    async def seek(self, vc, delta):
+        """Moves playback of the current song by `delta` seconds. Returns the new position or None."""
+        player = state.get_player(vc.guild.id) if vc else None
+        if not vc or not (vc.is_playing() or vc.is_paused()) or not player.path:
+            return None
+        now = player.pause_start if player.is_paused else time.time()
+        target = max(0, player.elapsed() + delta)
+        if player.duration and target >= player.duration:
+            vc.stop() # Jumped past the end, same as skip
+            return None
+
+        source = vc.source
+        if isinstance(source, OggOpusSource):
+            index = state.CACHED_SONG_INDEX
+            entry = index.get_by_path(player.path)
+            if source.seek_index is None and entry:
+                source.seek_index = index.load_seek_index(player.path, entry['mtime'])
+            had_index = source.seek_index is not None
+            await asyncio.to_thread(source.seek, target)
+            if not had_index and entry:
+                index.save_seek_index(player.path, entry['mtime'], source.seek_index)
+        elif player.path in self.streams:
+            vc.source = self.open_stream(player.path, self.streams[player.path], start=target)
+            source.cleanup()
+        else:
+            # FFmpeg sources can't seek, restart the process at the new position
+            meta = await self.metadata.get(player.path)
+            vc.source = discord.FFmpegOpusAudio(player.path, executable=config.FFMPEG_EXE, codec=meta['codec'],
+                                                bitrate=min(meta['bitrate'] or 128, 512),
+                                                before_options=f"-ss {target:.2f}")
+            source.cleanup()
+
+        # Keep the progress bar in sync with the new position
+        player.start_t = now - target
+        self.journal.position(player.gid, target)
+        self.updater.request(player)
+        return target
 
     async def start_or_queue(self, ctx, message):
         vc = ctx.voice_client or await ctx.author.voice.channel.connect()
@@ -128,104 +464,217 @@ class Music(commands.Cog):
         if not vc.is_playing() and not vc.is_paused():
             await self.play_next_song(vc, gid, ctx.channel)
         else:
+            self.updater.request(state.get_player(gid)) # 'Up Next' may have changed
             await ctx.send(message, delete_after=5)
 
-    def build_index(self):
-        state.CACHED_SONG_INDEX = []
-        for root, _, files in os.walk(config.MUSIC_FOLDER):
-            for f in files:
-                if f.endswith(".opus"):
-                    state.CACHED_SONG_INDEX.append({'title': f[:-5], 'path': os.path.join(root, f)})
+    async def sync_index(self):
+        """Checks the loaded snapshot against the filesystem without blocking the loop."""
+        index = state.CACHED_SONG_INDEX
+        changes = await asyncio.to_thread(index.scan_changes, *index.sync_snapshot())
+        added, removed = await index.apply_changes_async(changes)
+        print(f"Library synced: {len(index)} songs (+{added} / -{removed})")
+        await self.trim_singles()
+
+    async def trim_singles(self):
+        """Deletes the least recently played Singles once the folder is over its budget."""
+        if self.trimming or config.COORDINATOR: return # the coordinator owns the budget when sharded
+        self.trimming = True
+        try:
+            protected = set()
+            for player in state.PLAYERS.values():
+                protected.add(player.path)
+                protected.update(track.path for track in player.queue)
+                if player.prefetched: protected.add(player.prefetched[1])
+            victims = self.singles.plan(protected)
+            if not victims: return
+
+            # Out of the index first so nothing new gets queued from them while they are deleted
+            index = state.CACHED_SONG_INDEX
+            for entry in victims: index.remove(entry['path'])
+            gone = set(await asyncio.to_thread(self.singles.delete, [e['path'] for e in victims]))
+            for entry in victims:
+                if entry['path'] not in gone: # Couldn't delete it (file in use...), keep it listed
+                    index.add(entry['path'], entry['mtime'], entry['size'])
+            print(f"Singles cache: evicted {len(gone)} files")
+        finally:
+            self.trimming = False
 
     async def download_single(self, ctx, url, title, video_id):
         """Checks cache or downloads a single video; returns (file_path, title)."""
-        existing = next((i['path'] for i in state.CACHED_SONG_INDEX if f"[{video_id}]" in i['path']), None)
+        cached = state.CACHED_SONG_INDEX.get_by_id(video_id)
+        existing = cached['path'] if cached else None
         
+        if not existing and config.STREAM_ON_MISS:
+            # Play straight from the remote stream while the file is saved for next time
+            try:
+                info = await resolve_stream(self.extractors, url)
+            except Exception:
+                info = None # Fall back to a normal download
+            if info:
+                job = self.downloads.submit(url, None, INTERACTIVE, group=str(ctx.guild.id),
+                                            title=title, key=video_id)
+                job.future.add_done_callback(self.on_background_save)
+                msg = await ctx.send(f"📡 Streaming: **{title}** (saving to the library in the background)")
+                asyncio.create_task(delete_after_delay(msg, 3))
+                perf.mark('download')
+                return self.remember_stream(info), title
+
         if not existing:
             msg = await ctx.send(f"⏳ Downloading: **{title}**...")
-            with yt_dlp.YoutubeDL(config.YDL_OPTIONS) as ydl:
-                info = await asyncio.to_thread(ydl.extract_info, url, download=True)
-                existing = os.path.splitext(ydl.prepare_filename(info))[0] + ".opus"
-            self.build_index()
+            # Interactive priority: jumps ahead of any playlist being mirrored
+            job = self.downloads.submit(url, None, INTERACTIVE, group=str(ctx.guild.id),
+                                        title=title, key=video_id)
+            _, existing = await job.wait()
+            state.CACHED_SONG_INDEX.add(existing)
+            asyncio.create_task(self.trim_singles())
             asyncio.create_task(delete_after_delay(msg, 3))
         
+        perf.mark('download')
         return existing, title
 
-    async def process_playlist_download(self, ctx, playlist_title, entries):
-        """Handles sequential playlist downloading with a progress tracker and cancel flag."""
-        state.DOWNLOAD_ABORTED = False
-        
+    def on_background_save(self, future):
+        if future.cancelled() or future.exception():
+            return
+        state.CACHED_SONG_INDEX.add(future.result()[1])
+        asyncio.create_task(self.trim_singles())
+
+    async def iter_playlist_download(self, ctx, playlist_title, entries, source=None):
+        """
+        Yields (file_path, title) for each track, in playlist order, as soon as its file is on disk.
+        The folder's manifest remembers what is already mirrored, so only missing or failed
+        tracks become bulk download jobs (cancellable with !cancel) and a re-run resumes.
+        """
+        gid = str(ctx.guild.id)
         safe_folder = "".join([c for c in playlist_title if c.isalnum() or c in (' ', '-', '_')]).strip()
         playlist_path = os.path.join(config.MUSIC_FOLDER, safe_folder)
         os.makedirs(playlist_path, exist_ok=True)
-        
-        count = len(entries)
-        status_msg = await ctx.send(f"🚀 **Bulk Download:** `{safe_folder}`\n📦 Total: **{count}** songs.")
-
-        opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(playlist_path, '%(title)s [%(id)s].%(ext)s'),
-            'postprocessors': [{'key': 'FFmpegExtractAudio','preferredcodec': 'opus','preferredquality': '0'}],
-            'quiet': True, 
-            'ignoreerrors': True,
-            'cookiefile': 'cookies.txt',
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'socket_timeout': 30,
-            'retries': 3,
-            'remote_components': ['ejs:github'],
-        }
+        index = state.CACHED_SONG_INDEX
+
+        manifest = await asyncio.to_thread(PlaylistManifest.load, playlist_path)
+        resumed = bool(manifest.order)
+        new, gone = manifest.sync(source, playlist_title, entries)
+        # Files already in the folder (e.g. mirrored before manifests existed) count as done
+        on_disk = {e['id']: e['path'] for e in index.folder(safe_folder) if e['id']}
 
-        added_tracks = []
+        # Same download profile as singles, only the target folder changes
+        outtmpl = os.path.join(playlist_path, '%(title)s [%(id)s].%(ext)s')
+
+        # The scheduler spaces bulk jobs out per host (anti-bot protection) and lets single requests go first
+        tracks, jobs = list(manifest), {}
+        for track in tracks:
+            path = manifest.file_of(track) if track['status'] == DONE else None
+            if path and path not in index:
+                path = index.add(path)['path'] if os.path.exists(path) else None
+            path = path or on_disk.get(track['id'])
+            if path:
+                manifest.mark(track['id'], DONE, path)
+            else:
+                jobs[track['id']] = self.downloads.submit(track['url'], outtmpl, BULK, group=gid,
+                                                          title=track['title'], key=track['id'])
+
+        count = len(tracks)
+        status = f"🚀 **Bulk Download:** `{safe_folder}`\n📦 Total: **{count}** songs."
+        if len(jobs) < count: status += f" ({count - len(jobs)} already saved, {len(jobs)} to fetch)"
+        if resumed and (new or gone): status += f"\n🔄 Upstream changes: **+{new}** / **-{gone}**"
+        status_msg = await ctx.send(status)
+
+        added_count = 0
         failed_count = 0
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            for i, entry in enumerate(entries):
-                if state.DOWNLOAD_ABORTED:
-                    msg = await ctx.send(f"🚫 **Stop:** Saved {len(added_tracks)} songs to `{safe_folder}`.")
-                    asyncio.create_task(delete_after_delay(msg, 3))
-                    break
-                
-                if entry:
-                    v_url = entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"
-                    v_title = entry.get('title', 'Unknown Title')
-                    try:
-                        await status_msg.edit(content=f"⏳ **Downloading ({i+1}/{count}):**\n`{v_title}`")
-                        info = await asyncio.to_thread(ydl.extract_info, v_url, download=True)
-                        f_path = os.path.splitext(ydl.prepare_filename(info))[0] + ".opus"
-                        added_tracks.append((f_path, info.get('title', 'Unknown Title')))
-                        await asyncio.sleep(random.uniform(5, 15)) # Protection
-                    except Exception as e:
-                        err_str = str(e).lower()
-                        if "confirm you're not a bot" in err_str or "cookies are no longer valid" in err_str:
-                            await ctx.send("🚨 **CRITICAL:** YouTube has invalidated your cookies! Download stopped. Please refresh `cookies.txt`.")
-                            state.DOWNLOAD_ABORTED = True 
-                            log_error(v_title, "Cookie Rotation/Invalidation")
-                            break 
-                            
-                        failed_count += 1
-                        log_error(v_title, str(0)) 
+        unsaved = 0
+        aborted = False
+        try:
+            for track in tracks:
+                job = jobs.get(track['id'])
+                if job and (job.cancelled or gid not in job.groups):
+                    aborted = True  # !cancel (or the cookie check below) dropped the rest of the playlist
+                if aborted and (job is None or job.cancelled or gid not in job.groups):
+                    continue  # stopped: only downloads that were already running still get queued
+                if job is None:
+                    added_count += 1
+                    yield manifest.file_of(track), track['title']
+                    continue
+                try:
+                    if not aborted:
+                        progress = f"⏳ **Downloading ({added_count + failed_count + 1}/{count}):** `{safe_folder}`\n`{job.title}`"
+                        progress += f"\n▶️ Queued so far: **{added_count}**"
+                        if failed_count: progress += f" | ⚠️ Failed: **{failed_count}**"
+                        await status_msg.edit(content=progress)
+                    info, f_path = await job.wait()
+                    index.add(f_path)
+                    manifest.mark(track['id'], DONE, f_path)
+                    added_count += 1
+                    yield f_path, info.get('title', 'Unknown Title')
+                except asyncio.CancelledError:
+                    if not job.cancelled: raise
+                    aborted = True
+                except Exception as e:
+                    err_str = str(e).lower()
+                    if "confirm you're not a bot" in err_str or "cookies are no longer valid" in err_str:
+                        await ctx.send("🚨 **CRITICAL:** YouTube has invalidated your cookies! Download stopped. Please refresh `cookies.txt`.")
+                        self.downloads.cancel_group(gid)
+                        log_error(job.title, "Cookie Rotation/Invalidation")
+                        aborted = True
                         continue
 
-        self.build_index()
+                    manifest.mark(track['id'], FAILED)
+                    failed_count += 1
+                    log_error(job.title, str(e))
+
+                unsaved += 1
+                if unsaved >= 10: # Batched so long playlists don't rewrite the manifest per track
+                    await asyncio.to_thread(manifest.save, manifest.snapshot())
+                    unsaved = 0
+        finally:
+            # Also reached on !cancel and shutdown, so the next run knows what is done
+            manifest.save()
+
+        if aborted:
+            msg = await ctx.send(f"🚫 **Stop:** Saved {added_count} songs to `{safe_folder}`.")
+            asyncio.create_task(delete_after_delay(msg, 3))
         
-        report = f"✅ **Playlist Ready:** `{safe_folder}`\nQueued **{len(added_tracks)}** songs."
-        if failed_count > 0: report += f"\n⚠️ Failed: **{failed_count}** (Check `error_log.txt` for details)"
+        report = f"✅ **Playlist Ready:** `{safe_folder}`\nQueued **{added_count}** songs."
+        if failed_count > 0: report += f"\n⚠️ Failed: **{failed_count}** (Check `error_log.txt` for details, re-run the playlist to retry)"
         msg = await status_msg.edit(content=report)
         asyncio.create_task(delete_after_delay(msg, 3))
-        return added_tracks
+
+    async def stream_playlist(self, ctx, playlist_title, entries, source=None):
+        """Background task: each finished download goes straight into the queue (and starts playback)."""
+        gid = str(ctx.guild.id)
+        player = state.get_player(gid)
+        started = False  # joined voice for this playlist (retried per track until it works)
+        reported = False
+        async for track in self.iter_playlist_download(ctx, playlist_title, entries, source):
+            player.queue.append(Track(*track))
+            vc = ctx.voice_client
+            try:
+                if not started and not vc:
+                    await self.start_or_queue(ctx, "✅ Playlist is streaming into the queue.")
+                elif vc and not vc.is_playing() and not vc.is_paused():
+                    # Playback caught up with the downloads (or hadn't started yet)
+                    await self.play_next_song(vc, gid, ctx.channel)
+                else:
+                    self.updater.request(player)
+            except Exception as e:
+                # e.g. the requester left voice: keep mirroring (the files still get indexed
+                # and marked in the manifest), the songs just wait in the queue
+                log_error(playlist_title, f"Playlist playback: {e}")
+                if not reported:
+                    reported = True
+                    try:
+                        await ctx.send("⚠️ Couldn't start playback (are you in a voice channel?). "
+                                       "The playlist keeps downloading into the queue and starts once you join.")
+                    except discord.HTTPException:
+                        pass
+                continue
+            started = True
 
     async def process_youtube_logic(self, ctx, query, interaction: discord.Interaction = None):
         gid = str(ctx.guild.id)
         is_link = query.startswith(("http://", "https://", "www.", "youtu."))
 
-        fetch_opts = {
-            'quiet': True, 
-            'extract_flat': 'in_playlist', 
-            'remote_components': ['ejs:github']
-        }
         try:
-            with yt_dlp.YoutubeDL(fetch_opts) as ydl:
-                search_query = query if is_link else f"ytsearch5:{query}"
-                info = await asyncio.to_thread(ydl.extract_info, search_query, download=False)
+            info = await self.lookup(query, is_link)
+            perf.mark('search')
         except yt_dlp.utils.DownloadError:
             msg = await interaction.followup.send("❌ This link is not supported or is unreachable.", ephemeral=True)
             asyncio.create_task(delete_after_delay(msg, 5))
@@ -245,9 +694,11 @@ class Music(commands.Cog):
             if view.choice is None:
                 return
             elif view.choice == "playlist":
-                tracks = await self.process_playlist_download(ctx, info['title'], entries)
-                state.SONG_QUEUES[gid].extend(tracks)
-                return await self.start_or_queue(ctx, "✅ Playlist added to queue.") 
+                # Runs in the background: the first song plays as soon as it is downloaded
+                task = asyncio.create_task(self.stream_playlist(ctx, info['title'], entries, info.get('webpage_url', query)))
+                self.playlist_tasks.add(task)
+                task.add_done_callback(self.playlist_tasks.discard)
+                return
             elif view.choice == "song":
                 query = query.split('&list=')[0].split('?list=')[0]
 
@@ -266,44 +717,41 @@ class Music(commands.Cog):
             
             if view.selection:
                 f_path, title = await self.download_single(ctx, view.selection['url'], view.selection['title'], view.selection['id'])
-                state.SONG_QUEUES[gid].append((f_path, title))
+                state.get_player(gid).queue.append(Track(f_path, title, view.selection['id']))
                 await self.start_or_queue(ctx, f"✅ Queued: **{title}**")
             return
 
         # --- Case: Single Video Link ---
         v_info = info['entries'][0] if 'entries' in info else info
         f_path, title = await self.download_single(ctx, v_info['webpage_url'] if 'webpage_url' in v_info else query, v_info.get('title', 'Unknown Title'), v_info['id'])
-        state.SONG_QUEUES[gid].append((f_path, title))
+        state.get_player(gid).queue.append(Track(f_path, title, v_info['id']))
         msg = await self.start_or_queue(ctx, f"✅ Queued: **{title}**")
         asyncio.create_task(delete_after_delay(msg, 3))
 
     async def smart_play(self, ctx, query: str, interaction: discord.Interaction = None):
         gid = str(ctx.guild.id)
-        if gid not in state.SONG_QUEUES: state.SONG_QUEUES[gid] = deque()
         query_clean = query.strip().lower()
 
         # 1. Handle Direct Links (Skip local search)
         if query.startswith(("http://", "https://", "www.")):
             return await self.process_youtube_logic(ctx, query, interaction)
 
-        # 2. Local Folder Search
-        for entry in os.scandir(config.MUSIC_FOLDER):
-            if entry.is_dir() and entry.name.lower() == query_clean:
-                items = sorted(glob.glob(os.path.join(entry.path, '*.opus')))
-                for p in items: state.SONG_QUEUES[gid].append((p, os.path.basename(p)[:-5]))
-                return await self.start_or_queue(ctx, f"📁 Queued folder: **{entry.name}** ({len(items)} songs)")
-
-        # 3. Local Song Search (Fuzzy Match)
-        best_match = None
-        highest_score = 0
-        for item in state.CACHED_SONG_INDEX:
-            score = fuzz.token_set_ratio(query_clean, item['title'].lower())
-            if score > highest_score:
-                highest_score, best_match = score, item
+        # 2. Local Folder Search (exact name, straight from the index)
+        folder = state.CACHED_SONG_INDEX.find_folder(query_clean)
+        if folder:
+            perf.mark('search')
+            items = state.CACHED_SONG_INDEX.listing(folder)
+            state.get_player(gid).queue.extend(map(Track.from_entry, items))
+            return await self.start_or_queue(ctx, f"📁 Queued folder: **{folder}** ({len(items)} songs)")
+
+        # 3. Local Song Search (Fuzzy Match, runs in a worker thread)
+        matches = await self.search_engine.search(query_clean, limit=1)
+        best_match, highest_score = matches[0] if matches else (None, 0)
+        if highest_score >= 90: perf.mark('search')
 
         # 4. Threshold Decision (Adjust 90 to your liking)
         if highest_score >= 90:
-            state.SONG_QUEUES[gid].append((best_match['path'], best_match['title']))
+            state.get_player(gid).queue.append(Track.from_entry(best_match))
             await self.start_or_queue(ctx, f"✅ Found locally: **{best_match['title']}**")
         else:
             # No good local match -> Search YouTube
@@ -311,10 +759,36 @@ class Music(commands.Cog):
                 await ctx.send(f"🔍 Local match weak ({highest_score:.1f}%). Checking YouTube...", delete_after=3)
             await self.process_youtube_logic(ctx, query, interaction)
 
+    @app_commands.command(name="play", description="Play a song or folder from the library, or a YouTube search/link.")
+    @app_commands.describe(query="Song name, folder name or YouTube link")
+    async def play_slash(self, interaction: discord.Interaction, query: str):
+        perf.begin(interaction.guild.id)
+        await interaction.response.defer(ephemeral=True)
+        if not interaction.user.voice:
+            return await interaction.followup.send("❌ You must be in a voice channel first!", ephemeral=True)
+
+        vc = interaction.guild.voice_client
+        if not vc:
+            await interaction.user.voice.channel.connect()
+        elif vc.channel != interaction.user.voice.channel:
+            await vc.move_to(interaction.user.voice.channel)
+
+        ctx = await commands.Context.from_interaction(interaction)
+        await self.smart_play(ctx, query, interaction)
+
+    @play_slash.autocomplete("query")
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        # Index lookups only (no full-library scoring) so we stay well inside the 3s deadline
+        folders, entries = self.search_engine.suggest(current, limit=25)
+        choices = [app_commands.Choice(name=f"📁 {f}"[:100], value=f[:100]) for f in folders]
+        choices += [app_commands.Choice(name=e['title'][:100], value=e['title'][:100]) for e in entries]
+        return choices[:25]
+
     @commands.command(name="library", aliases=["lib"])
     async def library(self, ctx, *, query=None):
         gid = str(ctx.guild.id)
-        folders = sorted([e.name for e in os.scandir(config.MUSIC_FOLDER) if e.is_dir()])
+        index = state.CACHED_SONG_INDEX
+        folders = index.top_folders()
         
         # Check if query is a number or a name
         target_folder = None
@@ -328,26 +802,111 @@ class Music(commands.Cog):
                 target_folder = next((f for f in folders if f.lower() == query.lower()), None)
 
         if target_folder:
-            files = sorted(glob.glob(os.path.join(config.MUSIC_FOLDER, target_folder, '*.opus')))
-            state.LAST_VIEWED_LISTS[gid] = files # Store full paths for songs
-            res = f"📁 **{target_folder}**\n" + "\n".join([f"`{i+1:02}.` {os.path.basename(f)[:-5]}" for i,f in enumerate(files)])
-            return await ctx.send(res[:2000])
+            files = index.listing(target_folder)
+            state.LAST_VIEWED_LISTS[gid] = files # Index entries of the songs (shared listing, not a copy)
+            lines = (f"`{i+1:02}.` {e['title']}" for i, e in enumerate(files))
+            return await ctx.send(self.fit_message(f"📁 **{target_folder}**", lines))
 
         # Default: Show root folders
         state.LAST_VIEWED_LISTS[gid] = folders # Store folder names
-        res = "📂 **Library Playlists**\n" + "\n".join([f"`{i+1:02}.` {f}" for i,f in enumerate(folders)])
-        await ctx.send(res)
+        lines = (f"`{i+1:02}.` {f}" for i, f in enumerate(folders))
+        await ctx.send(self.fit_message("📂 **Library Playlists**", lines))
+
+    @staticmethod
+    def fit_message(header, lines, limit=2000):
+        """Joins lines under a header, stopping at the first one that doesn't fit (only those get formatted)."""
+        out, size = [header], len(header)
+        for line in lines:
+            size += len(line) + 1
+            if size > limit: break
+            out.append(line)
+        return "\n".join(out)
     
     @commands.command()
     async def cancel(self, ctx):
-        state.DOWNLOAD_ABORTED = True
+        self.downloads.cancel_group(str(ctx.guild.id))
         msg = await ctx.send("🛑 **Cancellation request received.** Finishing current song and stopping the rest...")
         asyncio.create_task(delete_after_delay(msg, 3))
+
+    @commands.command(name="perf")
+    @commands.is_owner()
+    async def perf_stats(self, ctx):
+        """Loop lag and per-stage latency (p50 / p99 / max) for this guild and overall."""
+        def row(label, hist):
+            return (f"`{label:<13}` p50 **{hist.quantile(0.5) * 1000:.0f}ms** · p99 **{hist.quantile(0.99) * 1000:.0f}ms**"
+                    f" · max {hist.max * 1000:.0f}ms · n={hist.count}")
+
+        embed = discord.Embed(title="⏱️ Performance", color=0x3498db)
+        lag = perf.REGISTRY.select('loop_lag')
+        embed.add_field(name="Event loop lag", value=row("loop", lag[0][1]) if lag else "No samples yet.", inline=False)
+        for scope, labels in (("This server", {'guild': str(ctx.guild.id)}), ("All servers", {})):
+            merged = {}
+            for found, hist in perf.REGISTRY.select('stage', **labels):
+                merged.setdefault(found['stage'], []).append(hist)
+            lines = [row(stage, perf.Histogram.merge(merged[stage])) for stage in perf.STAGES if stage in merged]
+            embed.add_field(name=f"Interaction → stage ({scope})", value="\n".join(lines) or "No samples yet.", inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="import")
+    @commands.is_owner()
+    async def import_folder(self, ctx, source: str, *, folder: str = None):
+        """Transcodes a folder of MP3/FLAC/M4A... on this machine into the library (see utils/importer.py)."""
+        if config.COORDINATOR:
+            return await ctx.send("❌ Sharded: the index is read-only here, run `python -m utils.importer` with the bot stopped.")
+        if not os.path.isdir(source):
+            return await ctx.send(f"❌ Not a folder: `{source}`")
+
+        status = await ctx.send(f"📥 **Import:** scanning `{source}`...")
+        async def progress(done, total):
+            if done % 10 == 0 or done == total:
+                await status.edit(content=f"📥 **Import:** transcoding **{done}/{total}**...")
+
+        importer = Importer(state.CACHED_SONG_INDEX, config.IMPORT_STATE)
+        converted, skipped, failed = await importer.run(source, folder, progress)
+        report = f"✅ **Import done:** **{len(converted)}** new songs, {skipped} already in the library."
+        if failed:
+            report += f"\n⚠️ Failed: **{len(failed)}** (Check `error_log.txt` for details)"
+            for path, error in failed: log_error(path, f"Import: {error}")
+        await status.edit(content=report)
+
+    @commands.command()
+    async def remove(self, ctx, position: int):
+        player = state.get_player(ctx.guild.id)
+        try:
+            track = player.queue.remove(position - 1)
+        except IndexError:
+            return await ctx.send(f"❌ The queue has {len(player.queue)} songs.", delete_after=3)
+        if position == 1: self.discard_prefetch(player)
+        self.updater.request(player)
+        await ctx.send(f"🗑️ Removed: **{track.title}**", delete_after=3)
+
+    @commands.command()
+    async def move(self, ctx, position: int, to: int = 1):
+        player = state.get_player(ctx.guild.id)
+        try:
+            track = player.queue.move(position - 1, to - 1)
+        except IndexError:
+            return await ctx.send(f"❌ The queue has {len(player.queue)} songs.", delete_after=3)
+        if 1 in (position, to): self.discard_prefetch(player)
+        self.updater.request(player)
+        await ctx.send(f"↕️ Moved **{track.title}** to #{min(max(to, 1), len(player.queue))}", delete_after=3)
+
+    @commands.command()
+    async def dedupe(self, ctx):
+        player = state.get_player(ctx.guild.id)
+        removed = player.queue.dedupe()
+        if removed:
+            self.discard_prefetch(player)
+            self.updater.request(player)
+        await ctx.send(f"🧹 Removed **{removed}** duplicate songs from the queue.", delete_after=3)
     
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"Music Cog loaded for {self.bot.user}")
-        self.build_index()
+        # Snapshot was loaded in cog_load, verify it against the disk in the background
+        # (when sharded the coordinator did it before any shard started)
+        if not config.COORDINATOR:
+            asyncio.create_task(self.sync_index())
         
         for guild in self.bot.guilds:
             channel = discord.utils.get(guild.text_channels, name="music")
@@ -364,7 +923,11 @@ class Music(commands.Cog):
                 )
                 
                 msg = await channel.send(embed=idle_embed, view=PlayerControlView(self))
-                plstate.msg = msg  
+                state.get_player(guild.id).msg = msg
+
+        # Songs interrupted by the restart continue where they were
+        if self.resume_pending:
+            asyncio.create_task(self.resume_playback())
 
 async def setup(bot):
     await bot.add_cog(Music(bot))
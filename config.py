@@ -7,6 +7,11 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MUSIC_FOLDER = os.path.join(BASE_DIR, "Library")
 SINGLES_FOLDER = os.path.join(MUSIC_FOLDER, "Singles")
+INDEX_DB = os.path.join(BASE_DIR, "library_index.db") # Snapshot of the library index for fast startup
+QUEUE_JOURNAL = os.path.join(BASE_DIR, "queue_journal.jsonl") # Queues/now playing, restored after a restart
+PERF_EXPORT_FILE = os.path.join(BASE_DIR, "jukebox.prom") # Prometheus text export of !perf stats (None = off)
+LOOKUP_CACHE_FILE = os.path.join(BASE_DIR, "lookup_cache.json") # Cached YouTube searches/playlists (None = memory only)
+IMPORT_STATE = os.path.join(BASE_DIR, "import_state.json") # Sources already imported by utils/importer.py (None = always re-hash)
 
 # Path to your local tools
 FFMPEG_EXE = r"C:\Users\nsaka\Documents\ffmpeg\bin\ffmpeg.exe"
@@ -27,3 +32,27 @@ YDL_OPTIONS = {
     'retries': 3,          # Try 3 times before skipping
     'remote_components': ['ejs:github'],
 }
+
+# Library misses start playing straight from YouTube's audio stream while the
+# file is saved to Singles in the background (False = wait for the download)
+STREAM_ON_MISS = True
+YDL_STREAM_OPTIONS = {k: v for k, v in YDL_OPTIONS.items() if k not in ('outtmpl', 'postprocessors')}
+
+# After a restart, rejoin voice and continue the song that was playing at its saved position
+# (False = only restore the queues, playback starts again with the Play button)
+RESUME_PLAYBACK = True
+
+# Budget for Singles (one-off downloads); least recently played files are deleted past it (None = no limit)
+SINGLES_MAX_BYTES = 5 * 1024**3
+SINGLES_MAX_FILES = 2000
+
+# How long YouTube lookups are reused before asking the extractor again (seconds)
+LOOKUP_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 6 * 3600
+PLAYLIST_CACHE_TTL = 15 * 60 # Short, so tracks added upstream show up
+
+# Multi-process deployment (launcher.py): total Discord shards, None = as many as Discord recommends
+SHARD_COUNT = None
+# Set by launcher.py in shard processes: (address, authkey) of the download coordinator.
+# None = single process (bot.py), which scans the library and downloads by itself
+COORDINATOR = None
@@ -0,0 +1,110 @@
+"""
+Runs the bot as several processes, for when one process (one GIL) is the limit:
+
+    python launcher.py --processes 4              # shard count recommended by Discord
+    python launcher.py --processes 4 --shards 16
+
+The shards are split across the worker processes, each an AutoShardedBot with its own
+voice connections, extractors and search. One extra process, the download coordinator,
+syncs the library index and then is the only one writing to it: the workers load the
+SQLite snapshot read-only and send it their downloads (see utils/coordinator.py).
+For a single process just run bot.py.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+import discord
+
+import config
+from utils.coordinator import run_coordinator
+
+# Discord allows one IDENTIFY per 5 seconds; discord.py spaces a process's own shards,
+# so processes are started that far apart
+IDENTIFY_DELAY = 5
+
+
+def shard_path(path, n):
+    """Per-process copy of a state file: queue_journal.jsonl -> queue_journal.2.jsonl."""
+    if not path: return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{n}{ext}"
+
+
+def recommended_shards():
+    async def fetch():
+        client = discord.Client(intents=discord.Intents.none())
+        async with client:
+            await client.login(config.TOKEN)
+            shards, _, _ = await client.http.get_bot_gateway()
+        return shards
+    return asyncio.run(fetch())
+
+
+def run_shards(n, shard_ids, shard_count, coordinator):
+    """Worker process entry point."""
+    config.COORDINATOR = coordinator
+    # Each process keeps its own queues, lookups and stats (a guild always lands on the same shard)
+    config.QUEUE_JOURNAL = shard_path(config.QUEUE_JOURNAL, n)
+    config.LOOKUP_CACHE_FILE = shard_path(config.LOOKUP_CACHE_FILE, n)
+    config.PERF_EXPORT_FILE = shard_path(config.PERF_EXPORT_FILE, n)
+    import bot
+    try:
+        asyncio.run(bot.main(bot.make_bot(shard_ids, shard_count)))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes running shards")
+    parser.add_argument("--shards", type=int, default=config.SHARD_COUNT, help="total shards (default: Discord's recommendation)")
+    args = parser.parse_args()
+    if not config.TOKEN:
+        print("Error: DISCORD_TOKEN not found in .env file.")
+        return
+
+    shard_count = args.shards or recommended_shards()
+    processes = max(min(args.processes, shard_count), 1)
+    groups = [list(range(shard_count))[n::processes] for n in range(processes)]
+
+    ctx = multiprocessing.get_context("spawn") # same behaviour on Windows and Linux
+    authkey = os.urandom(16)
+    ready, child_end = ctx.Pipe(duplex=False)
+    coordinator = ctx.Process(target=run_coordinator, args=(authkey, child_end), name="coordinator")
+    coordinator.start()
+    address = ready.recv() # after the library sync, so workers load a fresh snapshot
+    print(f"[Launcher] Coordinator ready, starting {shard_count} shards in {processes} processes")
+
+    workers = {}
+    def spawn(n):
+        workers[n] = ctx.Process(target=run_shards, args=(n, groups[n], shard_count, (address, authkey)),
+                                 name=f"shards-{n}")
+        workers[n].start()
+
+    try:
+        for n in range(processes):
+            spawn(n)
+            time.sleep(IDENTIFY_DELAY * len(groups[n]))
+        while True:
+            if not coordinator.is_alive():
+                # Workers can't download or see library changes without it: stop so the service manager restarts us all
+                print(f"[Launcher] Coordinator exited ({coordinator.exitcode}), shutting down")
+                break
+            for n, proc in list(workers.items()):
+                if not proc.is_alive() and proc.exitcode != 0:
+                    print(f"[Launcher] Shards {groups[n]} exited ({proc.exitcode}), restarting")
+                    spawn(n)
+            time.sleep(5)
+    except KeyboardInterrupt:
+        pass # the children got the Ctrl+C too and are closing themselves
+    finally:
+        for proc in [*workers.values(), coordinator]:
+            proc.join(timeout=30)
+            if proc.is_alive(): proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
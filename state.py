@@ -1,15 +1,51 @@
-class PlayerState:
-    def __init__(self):
+import time
+
+import config
+from utils.library_index import LibraryIndex
+from utils.track_queue import TrackQueue
+
+
+class GuildPlayer:
+    """Everything one guild's player owns: its queue, voice client, now-playing timing, player message and prefetch."""
+
+    def __init__(self, gid):
+        self.gid = gid
+        self.queue = TrackQueue(on_change=journal_hook(gid))
+        self.vc = None
         self.msg = None
+        self.channel = None  # text channel the player posts to
+        self.track = None    # Track playing now
+        self.path = None
+        self.title = ""
         self.start_t = 0
         self.duration = 0
-        self.title = ""
         self.is_paused = False
         self.pause_start = 0
+        self.prefetched = None     # (queue item, source, meta) ready for the handoff
+        self.prefetch_task = None  # Task waiting to prefetch the head of the queue
+
+    def elapsed(self):
+        """Seconds into the current song, frozen while paused."""
+        return (self.pause_start if self.is_paused else time.time()) - self.start_t
+
+
+def journal_hook(gid):
+    """Forwards a guild's queue changes to the queue journal of whichever music cog is loaded."""
+    def hook(op, *args):
+        if JOURNAL: JOURNAL.queue_changed(gid, op, *args)
+    return hook
+
+
+def get_player(gid):
+    """Returns the guild's player, creating it on first use. Accepts an int or str guild id."""
+    gid = str(gid)
+    if gid not in PLAYERS:
+        PLAYERS[gid] = GuildPlayer(gid)
+    return PLAYERS[gid]
+
 
 # Global State Instances
-STATE = PlayerState()
-SONG_QUEUES = {}
-CACHED_SONG_INDEX = []
-LAST_VIEWED_LISTS = {} 
-DOWNLOAD_ABORTED = False
+PLAYERS = {}  # gid -> GuildPlayer
+CACHED_SONG_INDEX = LibraryIndex(config.MUSIC_FOLDER)
+LAST_VIEWED_LISTS = {}
+JOURNAL = None  # QueueJournal, set by the music cog once its saved queues are restored
@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+import discord
+
+# Lower number = more important
+URGENT, PROGRESS = 0, 1
+
+
+class PlayerUpdater:
+    """
+    Edits the player messages of every guild from one shared priority queue.
+    - Renders are compared with the last embed sent, unchanged ones cost no REST call.
+    - Urgent requests (skip, shuffle, queue adds...) wait `coalesce` seconds so a
+      burst of changes turns into a single edit.
+    - Each channel gets at most `per_window` edits per `window` seconds. Progress
+      ticks over budget are dropped (the next tick is fresher anyway), urgent
+      ones are pushed back until the bucket frees up.
+    """
+
+    def __init__(self, render, workers=4, per_window=5, window=5.0, coalesce=0.75):
+        self.render = render      # player -> Embed, or None if there is nothing to show
+        self.workers = workers
+        self.per_window = per_window
+        self.window = window
+        self.coalesce = coalesce
+        self._heap = []           # (due, priority, seq, player)
+        self._queued = {}         # gid -> (due, priority) of its live heap entry
+        self._sending = set()     # gids with an edit in flight
+        self._last = {}           # message id -> embed dict last sent
+        self._edits = {}          # channel id -> deque of edit timestamps
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks: task.cancel()
+        self._tasks = []
+
+    def request(self, player, urgent=True):
+        """Schedules a refresh of this guild's player message. Repeated requests merge."""
+        if not player.msg: return
+        priority = URGENT if urgent else PROGRESS
+        queued = self._queued.get(player.gid)
+        if queued and queued[1] <= priority:
+            return  # something at least as important is already on its way
+        self._schedule(player, time.monotonic() + (self.coalesce if urgent else 0), priority)
+
+    def mark_sent(self, player, embed):
+        """Records an edit made outside the updater (e.g. the song change that also swaps the view)."""
+        if player.msg:
+            self._last[player.msg.id] = embed.to_dict()
+            self._bucket(player.msg.channel.id).append(time.monotonic())
+
+    def _schedule(self, player, due, priority):
+        self._queued[player.gid] = (due, priority)
+        heapq.heappush(self._heap, (due, priority, next(self._seq), player))
+        self._wake.set()
+
+    def _bucket(self, channel_id):
+        bucket = self._edits.setdefault(channel_id, deque())
+        now = time.monotonic()
+        while bucket and now - bucket[0] > self.window:
+            bucket.popleft()
+        return bucket
+
+    async def _next_due(self):
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            due, priority, _, player = self._heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if self._queued.get(player.gid) != (due, priority):
+                continue  # superseded by a newer request
+            del self._queued[player.gid]
+            return player, priority
+
+    async def _worker(self):
+        while True:
+            player, priority = await self._next_due()
+            msg = player.msg
+            if not msg: continue
+
+            # One edit per message at a time, so an older render can't land after a newer one
+            if player.gid in self._sending:
+                self._schedule(player, time.monotonic() + self.coalesce, priority)
+                continue
+
+            bucket = self._bucket(msg.channel.id)
+            if len(bucket) >= self.per_window:
+                if priority == URGENT:
+                    self._schedule(player, bucket[0] + self.window, priority)
+                continue
+
+            embed = self.render(player)
+            if embed is None: continue
+            data = embed.to_dict()
+            if self._last.get(msg.id) == data: continue
+
+            bucket.append(time.monotonic())
+            self._sending.add(player.gid)
+            try:
+                await msg.edit(embed=embed)
+                self._last[msg.id] = data
+            except discord.NotFound:
+                self._last.pop(msg.id, None)
+            except Exception:
+                pass # Guild unavailable, missing permissions...
+            finally:
+                self._sending.discard(player.gid)
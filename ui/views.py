@@ -1,19 +1,31 @@
 import discord
 import asyncio
 import time
-import random
-import os
-import glob
-from collections import deque
 
-import config
 import state
+from utils import perf
 from utils.helpers import delete_after_delay
+from utils.track_queue import Track
 
 # Forward declaration to avoid circular import issues if needed
 # But logic functions will be imported from cogs.music or passed as callbacks
 
-class PlayerControlView(discord.ui.View):
+class LiveCog:
+    """
+    For views and modals: `self.music_cog` is whichever Music cog is loaded now.
+    The player message outlives a !reload, and its buttons must not drive the unloaded cog.
+    """
+
+    @property
+    def music_cog(self):
+        return self._music_cog.bot.get_cog("Music") or self._music_cog
+
+    @music_cog.setter
+    def music_cog(self, cog):
+        self._music_cog = cog
+
+
+class PlayerControlView(LiveCog, discord.ui.View):
     def __init__(self, music_cog):
         super().__init__(timeout=None)
         self.music_cog = music_cog
@@ -22,6 +34,7 @@ class PlayerControlView(discord.ui.View):
     async def play_pause_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         vc = interaction.guild.voice_client
         gid = str(interaction.guild.id)
+        player = state.get_player(gid)
 
         # 1. Start Engine: Bot is not playing and not paused (Idle state)
         if not vc or (not vc.is_playing() and not vc.is_paused()):
@@ -33,7 +46,7 @@ class PlayerControlView(discord.ui.View):
                     return await interaction.response.send_message("❌ Please join a voice channel first!", ephemeral=True)
 
             # Check if there is anything to play
-            if gid in state.SONG_QUEUES and len(state.SONG_QUEUES[gid]) > 0:
+            if player.queue:
                 await self.music_cog.play_next_song(vc, gid, interaction.channel)
                 # Update UI to "Playing" state
                 button.emoji = "⏸️"
@@ -46,16 +59,15 @@ class PlayerControlView(discord.ui.View):
         # 2. Currently Playing -> Pause it
         elif vc.is_playing():
             vc.pause()
-            state.STATE.is_paused, state.STATE.pause_start = True, time.time()
+            player.is_paused, player.pause_start = True, time.time()
             button.emoji = "▶️"
             button.style = discord.ButtonStyle.success # Green for "Resume"
 
         # 3. Currently Paused -> Resume it
         elif vc.is_paused():
             vc.resume()
-            if hasattr(state.STATE, 'pause_start'): # Safety check
-                state.STATE.start_t += (time.time() - state.STATE.pause_start)
-            state.STATE.is_paused = False
+            player.start_t += (time.time() - player.pause_start)
+            player.is_paused = False
             button.emoji = "⏸️"
             button.style = discord.ButtonStyle.secondary
 
@@ -70,18 +82,20 @@ class PlayerControlView(discord.ui.View):
 
     @discord.ui.button(label="", style=discord.ButtonStyle.secondary, emoji="🔀")
     async def shuffle_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        gid = str(interaction.guild.id)
-        if gid in state.SONG_QUEUES:
-            q_list = list(state.SONG_QUEUES[gid])
-            random.shuffle(q_list)
-            state.SONG_QUEUES[gid] = deque(q_list)
+        player = state.get_player(interaction.guild.id)
+        if player.queue:
+            player.queue.shuffle()
+            self.music_cog.discard_prefetch(player)
+            self.music_cog.updater.request(player)
         await interaction.response.defer()
     
     @discord.ui.button(label="", style=discord.ButtonStyle.secondary, emoji="🗑️")
     async def clear_queue_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        gid = str(interaction.guild.id)
-        if gid in state.SONG_QUEUES:
-            state.SONG_QUEUES[gid].clear()
+        player = state.get_player(interaction.guild.id)
+        if player.queue:
+            player.queue.clear()
+            self.music_cog.discard_prefetch(player)
+            self.music_cog.updater.request(player)
             # Lively feedback: Change label to show it worked
             button.label = "Cleared!"
             button.disabled = True # Briefly disable to prevent spam
@@ -97,12 +111,13 @@ class PlayerControlView(discord.ui.View):
 
     @discord.ui.button(label="", style=discord.ButtonStyle.danger, emoji="⏹️")
     async def stop_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        gid = str(interaction.guild.id)
-        if gid in state.SONG_QUEUES: state.SONG_QUEUES[gid].clear()
+        player = state.get_player(interaction.guild.id)
+        player.queue.clear()
         
         vc = interaction.guild.voice_client
         if vc:
-            state.STATE.start_t = 0
+            player.start_t = 0
+            self.music_cog.discard_prefetch(player)
             await vc.disconnect(force=True)
             
         # Reset the player to its "Idle" state instead of clearing it
@@ -118,23 +133,34 @@ class PlayerControlView(discord.ui.View):
         # 1. Tell Discord to wait (This is your first response)
         await interaction.response.defer(ephemeral=True)
         
-        gid = str(interaction.guild.id)
-        queue_items = list(state.SONG_QUEUES.get(gid, [])) 
+        queue = state.get_player(interaction.guild.id).queue
         
-        if not queue_items:
+        if not queue:
             # Use followup because we already deferred
             msg = await interaction.followup.send("Queue is currently empty!", ephemeral=True, wait=True)
             asyncio.create_task(delete_after_delay(msg, 3))
             return msg
             
-        # 2. Generate pages
-        full_list = [f"**{i+1}.** {item[1]}" for i, item in enumerate(queue_items)]
-        pages = ["\n".join(full_list[i:i+15]) for i in range(0, len(full_list), 15)]
-        
-        # 3. Create the view and send via FOLLOWUP
-        view = QueueView(pages, interaction.user.id)
+        # 2. Create the view (it formats one page at a time) and send via FOLLOWUP
+        view = QueueView(queue, interaction.user.id)
         await interaction.followup.send(embed=view.create_embed(), view=view, ephemeral=True)
         
+    async def _seek(self, interaction: discord.Interaction, delta):
+        await interaction.response.defer()
+        await self.music_cog.seek(interaction.guild.voice_client, delta)
+
+    @discord.ui.button(label="1m", style=discord.ButtonStyle.secondary, emoji="⏪", row=2)
+    async def back_1m_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._seek(interaction, -60)
+
+    @discord.ui.button(label="1m", style=discord.ButtonStyle.secondary, emoji="⏩", row=2)
+    async def forward_1m_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._seek(interaction, 60)
+
+    @discord.ui.button(label="10m", style=discord.ButtonStyle.secondary, emoji="⏩", row=2)
+    async def forward_10m_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._seek(interaction, 600)
+
     @discord.ui.button(label="Help", style=discord.ButtonStyle.secondary, emoji="❓", row=1)
     async def help_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         embed = discord.Embed(
@@ -146,6 +172,7 @@ class PlayerControlView(discord.ui.View):
         embed.add_field(name="!search <query/link>", value="Search YT or play a direct link.", inline=False)
         embed.add_field(name="!library", value="Lists all local folders.", inline=False)
         embed.add_field(name="!queue", value="Shows the current song list.", inline=False)
+        embed.add_field(name="!remove <n> / !move <n> [to]", value="Removes a queued song, or moves it (default: up next).", inline=False)
         
         # Because this is a BUTTON click, ephemeral=True works!
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -161,7 +188,7 @@ class PlayerControlView(discord.ui.View):
     async def search_modal_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_modal(SearchModal(self.music_cog))
         
-class SearchModal(discord.ui.Modal, title="Request a Song or Link"):
+class SearchModal(LiveCog, discord.ui.Modal, title="Request a Song or Link"):
     query = discord.ui.TextInput(label="Song Name or YouTube Link", placeholder="e.g. Linkin Park Numb", required=True)
 
     def __init__(self, music_cog):
@@ -169,6 +196,7 @@ class SearchModal(discord.ui.Modal, title="Request a Song or Link"):
         self.music_cog = music_cog
 
     async def on_submit(self, interaction: discord.Interaction):
+        perf.begin(interaction.guild.id)
 
         
         # 1. Defer to give the bot time for fuzzy searching and YT API calls
@@ -195,7 +223,7 @@ class SearchModal(discord.ui.Modal, title="Request a Song or Link"):
         asyncio.create_task(delete_after_delay(msg, 2))  
         
         
-class LibraryGrid(discord.ui.View):
+class LibraryGrid(LiveCog, discord.ui.View):
     def __init__(self, user_id, interaction, music_cog, folder=None, page=0):
         super().__init__(timeout=60)
         self.user_id = user_id
@@ -206,9 +234,8 @@ class LibraryGrid(discord.ui.View):
         self.opening_interaction = interaction
         self.music_cog = music_cog
         if folder:
-            path = os.path.join(config.MUSIC_FOLDER, folder)
-            # Find all opus files in the selected folder
-            self.files = sorted(glob.glob(os.path.join(path, '*.opus')))
+            # Pre-sorted index listing (shared, don't modify): no disk access per click or page
+            self.files = state.CACHED_SONG_INDEX.listing(folder)
         
         self.create_interface()
 
@@ -217,7 +244,7 @@ class LibraryGrid(discord.ui.View):
         
         # --- FOLDER VIEW (Logic remains same) ---
         if not self.folder:
-            folders = sorted([e.name for e in os.scandir(config.MUSIC_FOLDER) if e.is_dir()])
+            folders = state.CACHED_SONG_INDEX.top_folders()
             for f_name in folders[:25]:
                 btn = discord.ui.Button(label=f_name[:20], style=discord.ButtonStyle.secondary, emoji="📁")
                 btn.callback = self.make_folder_callback(f_name)
@@ -234,14 +261,13 @@ class LibraryGrid(discord.ui.View):
             row = i // 5  # Keep buttons in 4 rows of 5
             
             if abs_index < len(self.files):
-                full_path = self.files[abs_index]
-                title = os.path.basename(full_path)[:-5]
+                entry = self.files[abs_index]
                 btn = discord.ui.Button(
                     label=str(display_number), 
                     style=discord.ButtonStyle.primary,
                     row=row
                 )
-                btn.callback = self.make_song_callback(full_path, title)
+                btn.callback = self.make_song_callback(entry['path'], entry['title'])
             else:
                 # Create a disabled placeholder button
                 btn = discord.ui.Button(label=str(display_number), style=discord.ButtonStyle.secondary, disabled=True, row=row)
@@ -296,15 +322,15 @@ class LibraryGrid(discord.ui.View):
             return
 
         # 2. Second Click: Execution
+        perf.begin(interaction.guild.id)
         self.confirm_play_all = False 
         await interaction.response.defer(ephemeral=True)
         
         gid = str(interaction.guild.id)
-        if gid not in state.SONG_QUEUES: state.SONG_QUEUES[gid] = deque()
+        player = state.get_player(gid)
         
-        for full_path in self.files:
-            title = os.path.basename(full_path)[:-5]
-            state.SONG_QUEUES[gid].append((full_path, title))
+        player.queue.extend(map(Track.from_entry, self.files))
+        self.music_cog.updater.request(player)
             
         msg = await interaction.followup.send(f"✅ Added {len(self.files)} songs to queue!", ephemeral=True)
         asyncio.create_task(delete_after_delay(interaction, 3))
@@ -382,8 +408,8 @@ class LibraryGrid(discord.ui.View):
         current_batch = self.files[start_index : start_index + 20]
         
         song_list = ""
-        for i, path in enumerate(current_batch):
-            title = os.path.basename(path)[:-5]
+        for i, entry in enumerate(current_batch):
+            title = entry['title']
             # Match the button number in the text list
             display_number = start_index + i + 1
             song_list += f"`{display_number:02}.` {title[:50]}\n"
@@ -406,12 +432,14 @@ class LibraryGrid(discord.ui.View):
 
     def make_song_callback(self, path, title):
         async def callback(interaction: discord.Interaction):
+            perf.begin(interaction.guild.id)
             # 1. ADD THIS LINE - It fixes the "Unknown Webhook" error
             await interaction.response.defer(ephemeral=True)
 
             gid = str(interaction.guild.id)
-            if gid not in state.SONG_QUEUES: state.SONG_QUEUES[gid] = deque()
-            state.SONG_QUEUES[gid].append((path, title))
+            player = state.get_player(gid)
+            player.queue.append(Track(path, title))
+            self.music_cog.updater.request(player)
             
             # 2. Use .send() (Correct for followups)
             msg = await interaction.followup.send(f"✅ Queued: **{title}**", ephemeral=True)
@@ -464,24 +492,32 @@ class LibraryGrid(discord.ui.View):
     
 
 class QueueView(discord.ui.View):
-    def __init__(self, pages, author_id, current_page=0):
+    PAGE_SIZE = 15
+
+    def __init__(self, queue, author_id, current_page=0):
         super().__init__(timeout=60)
-        self.pages = pages
+        self.queue = queue  # live TrackQueue: pages reflect changes made while the view is open
         self.author_id = author_id
         self.current_page = current_page
 
+    def page_count(self):
+        return self.queue.page_count(self.PAGE_SIZE)
+
     def create_embed(self):
-        # Fallback if pages list is somehow empty to prevent IndexError
-        if not self.pages:
+        # Fallback if the queue emptied meanwhile, to prevent an empty page
+        if not self.queue:
             return discord.Embed(title="🎶 Current Queue", description="The queue is currently empty.", color=0x3498db)
-            
-        page_content = self.pages[self.current_page]
+
+        self.current_page = min(self.current_page, self.page_count() - 1)
+        start = self.current_page * self.PAGE_SIZE
+        page_content = "\n".join(f"**{start + i + 1}.** {track.title}"
+                                 for i, track in enumerate(self.queue.page(self.current_page, self.PAGE_SIZE)))
         embed = discord.Embed(
             title="🎶 Current Queue", 
             description=page_content, 
             color=0x3498db
         )
-        embed.set_footer(text=f"Page {self.current_page + 1} of {len(self.pages)}")
+        embed.set_footer(text=f"Page {self.current_page + 1} of {self.page_count()}")
         return embed
 
     @discord.ui.button(label="", emoji="⬅️", style=discord.ButtonStyle.gray)
@@ -494,7 +530,7 @@ class QueueView(discord.ui.View):
 
     @discord.ui.button(label="", emoji="➡️", style=discord.ButtonStyle.gray)
     async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.current_page < len(self.pages) - 1:
+        if self.current_page < self.page_count() - 1:
             self.current_page += 1
             await interaction.response.edit_message(embed=self.create_embed(), view=self)
         else:
@@ -527,7 +563,7 @@ class PlaylistSelectView(discord.ui.View):
 
 
 
-class YouTubeSelectionView(discord.ui.View):
+class YouTubeSelectionView(LiveCog, discord.ui.View):
     def __init__(self, ctx, results, music_cog):
         super().__init__(timeout=30)
         self.ctx = ctx
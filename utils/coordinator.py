@@ -0,0 +1,298 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from yt_dlp.utils import DownloadError
+
+import config
+from utils.downloads import DownloadJob, DownloadScheduler, INTERACTIVE, BULK
+from utils.extractors import ExtractorPool
+from utils.library_index import LibraryIndex, TRACK_FIELDS, META_FIELDS
+from utils.singles_cache import SinglesCache
+
+# Shards don't report their queues: Singles played or downloaded this recently are never evicted
+SINGLES_GRACE = 3600
+
+# Messages are tuples, the first item says what it is.
+#   shard -> coordinator: ('download', req, url, outtmpl, priority, group, title, key), ('cancel_group', group),
+#                         ('touch', path, when), ('persist', row), ('seek_index', path, mtime, seek_index)
+#   coordinator -> shard: ('done', req, info, path), ('failed', req, message), ('cancelled', req),
+#                         ('index', added, removed), ('meta', row)
+
+
+class DownloadCoordinator:
+    """
+    The one process of a sharded deployment (see launcher.py) that writes to the library:
+    it syncs the index snapshot that the shards load read-only, runs every download
+    through one DownloadScheduler (so per-host limits and single-flight hold across all
+    shards), keeps the Singles budget and broadcasts each library change to the shards.
+    """
+
+    def __init__(self, authkey):
+        self.authkey = authkey
+        self.index = LibraryIndex(config.MUSIC_FOLDER)
+        self.extractors = ExtractorPool(lookup_workers=0)  # searches and streams stay in the shards
+        self.downloads = DownloadScheduler(self.extractors)
+        self.singles = SinglesCache(self.index, config.SINGLES_FOLDER,
+                                    config.SINGLES_MAX_BYTES, config.SINGLES_MAX_FILES)
+        self.shards = set()  # open connections
+        self.trimming = False
+        self.listener = None
+        self.loop = None
+
+    async def serve(self, ready):
+        """Syncs the library, then sends the listener address through `ready` and serves until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        index = self.index
+        # Nothing searches here: the title trigrams the load defers are never built
+        await asyncio.to_thread(index.open_snapshot, config.INDEX_DB)
+        changes = await asyncio.to_thread(index.scan_changes, *index.sync_snapshot())
+        added, removed = await index.apply_changes_async(changes)
+        print(f"[Coordinator] Library synced: {len(index)} songs (+{added} / -{removed})")
+        await self.trim()
+
+        self.extractors.start()
+        self.downloads.start()
+        self.listener = Listener(authkey=self.authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+        ready.send(self.listener.address)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.listener.close()
+            for conn in list(self.shards): conn.close()
+            self.downloads.stop()
+            self.extractors.stop()
+
+    # --- Connections (a reader thread per shard, everything else on the loop) ---
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # listener closed
+            except Exception:
+                continue  # failed handshake (wrong authkey)
+            self.loop.call_soon_threadsafe(self.shards.add, conn)
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self.loop.call_soon_threadsafe(self.handle, conn, msg)
+            except RuntimeError:
+                return  # loop closed, shutting down
+        try:
+            self.loop.call_soon_threadsafe(self.shards.discard, conn)
+        except RuntimeError:
+            pass
+
+    def send(self, conn, *msg):
+        try:
+            conn.send(msg)
+        except OSError:
+            self.shards.discard(conn)
+
+    def broadcast(self, *msg, skip=None):
+        for conn in list(self.shards):
+            if conn is not skip: self.send(conn, *msg)
+
+    # --- Requests ---
+    def handle(self, conn, msg):
+        op, args = msg[0], msg[1:]
+        if op == 'download':
+            req, url, outtmpl, priority, group, title, key = args
+            job = self.downloads.submit(url, outtmpl, priority, group, title, key)
+            job.future.add_done_callback(lambda future: self.finished(conn, req, future))
+        elif op == 'cancel_group':
+            self.downloads.cancel_group(args[0])
+        elif op == 'touch':
+            self.index.touch(*args)
+        elif op == 'persist':
+            self.persist(conn, args[0])
+        elif op == 'seek_index':
+            self.index.save_seek_index(*args)
+
+    def finished(self, conn, req, future):
+        if future.cancelled():
+            self.send(conn, 'cancelled', req)
+        elif future.exception():
+            # Only the message: exceptions don't all pickle, and the shards only look at the text
+            self.send(conn, 'failed', req, str(future.exception()))
+        else:
+            info, path = future.result()
+            self.register(path)
+            self.send(conn, 'done', req, info, path)
+
+    def register(self, path):
+        """Adds a finished download to the index and tells every shard (once, however many asked for it)."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        entry = self.index.get_by_path(path)
+        if entry and entry['mtime'] == st.st_mtime:
+            return
+        entry = self.index.add(path, st.st_mtime, st.st_size)
+        self.broadcast('index', [(entry['path'], st.st_mtime, st.st_size)], [])
+        asyncio.create_task(self.trim())
+
+    def persist(self, conn, row):
+        """Metadata a shard probed: stored once here, and handed to the other shards so they skip the probe."""
+        fields = dict(zip(TRACK_FIELDS, row))
+        entry = self.index.get_by_path(fields['path'])
+        if not entry or entry['mtime'] != fields['mtime'] or fields['meta_mtime'] is None:
+            return  # stale, or a plain add we already know about
+        entry.update((k, fields[k]) for k in META_FIELDS)
+        self.index.persist(entry)
+        self.broadcast('meta', row, skip=conn)
+
+    async def trim(self):
+        """Music.trim_singles for the whole deployment: evictions are broadcast as removals."""
+        if self.trimming: return
+        self.trimming = True
+        try:
+            index = self.index
+            recent = time.time() - SINGLES_GRACE
+            protected = {e['path'] for e in index.folder(self.singles.folder)
+                         if index.last_played.get(e['path'], e['mtime']) > recent}
+            victims = self.singles.plan(protected)
+            if not victims: return
+
+            for entry in victims: index.remove(entry['path'])
+            gone = set(await asyncio.to_thread(self.singles.delete, [e['path'] for e in victims]))
+            for entry in victims:
+                if entry['path'] not in gone:
+                    index.add(entry['path'], entry['mtime'], entry['size'])
+            if gone: self.broadcast('index', [], list(gone))
+            print(f"[Coordinator] Singles cache: evicted {len(gone)} files")
+        finally:
+            self.trimming = False
+
+
+def run_coordinator(authkey, ready):
+    """Process entry point, see launcher.py."""
+    try:
+        asyncio.run(DownloadCoordinator(authkey).serve(ready))
+    except KeyboardInterrupt:
+        pass
+
+
+class RemoteDownloads:
+    """
+    DownloadScheduler stand-in for shard processes: jobs run in the coordinator and
+    resolve here when it answers. It also carries the index writes of the shard's
+    read-only snapshot and applies the library changes the coordinator broadcasts.
+    """
+
+    def __init__(self, address, authkey, index):
+        self.address = address
+        self.authkey = authkey
+        self.index = index
+        self._conn = None
+        self._jobs = {}  # request id -> DownloadJob
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()  # index writes can come from worker threads
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._conn = Client(self.address, authkey=self.authkey)
+        self.index.forward = self.forward
+        threading.Thread(target=self._read, args=(self._conn,), daemon=True).start()
+
+    def stop(self):
+        if self.index.forward == self.forward: self.index.forward = None
+        if self._conn: self._conn.close()
+        self._conn = None
+        for job in self._jobs.values(): job.cancel()
+        self._jobs.clear()
+
+    def send(self, *msg):
+        with self._send_lock:
+            if not self._conn: raise ConnectionError("Not connected to the download coordinator")
+            self._conn.send(msg)
+
+    def forward(self, op, *args):
+        """LibraryIndex.forward: plays/metadata are only an optimisation, dropped if the coordinator is gone."""
+        try:
+            self.send(op, *args)
+        except OSError:
+            pass
+
+    def submit(self, url, outtmpl=None, priority=INTERACTIVE, group=None, title="", key=None):
+        """Same as DownloadScheduler.submit; single-flight happens in the coordinator, across shards."""
+        job = DownloadJob(url, outtmpl, priority, group, title, key)
+        req = next(self._ids)
+        self._jobs[req] = job
+        try:
+            self.send('download', req, url, outtmpl, priority, group, title, key)
+        except OSError as e:
+            del self._jobs[req]
+            job.future.set_exception(ConnectionError(f"Download coordinator unreachable: {e}"))
+        return job
+
+    def cancel_group(self, group):
+        dropped = 0
+        for job in self._jobs.values():
+            if job.priority >= BULK and group in job.groups and not job.cancelled:
+                job.cancel()
+                dropped += 1
+        try:
+            self.send('cancel_group', group)
+        except OSError:
+            pass
+        return dropped
+
+    def pending_count(self, group=None):
+        return sum(1 for job in self._jobs.values() if group is None or group in job.groups)
+
+    def _read(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, msg)
+            except RuntimeError:
+                return  # loop closed, shutting down
+        try:
+            self._loop.call_soon_threadsafe(self._lost, conn)
+        except RuntimeError:
+            pass
+
+    def _dispatch(self, msg):
+        op, args = msg[0], msg[1:]
+        if op in ('done', 'failed', 'cancelled'):
+            job = self._jobs.pop(args[0], None)
+            if not job or job.future.done():
+                return  # cancelled here meanwhile
+            if op == 'done':
+                job.future.set_result(args[1:])
+            elif op == 'failed':
+                job.future.set_exception(DownloadError(args[1]))
+            else:
+                job.cancel()
+        elif op == 'index':
+            self.index.apply_remote(*args)
+        elif op == 'meta':
+            fields = dict(zip(TRACK_FIELDS, args[0]))
+            entry = self.index.get_by_path(fields['path'])
+            if entry and entry['mtime'] == fields['mtime']:
+                entry.update((k, fields[k]) for k in META_FIELDS)
+
+    def _lost(self, conn):
+        if conn is not self._conn: return  # stopped on purpose
+        print("[Shard] Lost the download coordinator, downloads will fail until restart")
+        self._conn = None
+        for job in self._jobs.values():
+            if not job.future.done(): job.future.set_exception(ConnectionError("Download coordinator went away"))
+        self._jobs.clear()
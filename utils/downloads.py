@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import itertools
+import os
+import random
+import time
+from urllib.parse import urlparse
+
+# Lower number = served first
+INTERACTIVE, BULK = 0, 10
+
+
+def host_of(url):
+    """Politeness key for a URL: youtu.be, www.youtube.com, music.youtube.com... all count as youtube.com."""
+    host = (urlparse(url).hostname or "").lower()
+    if host in ("youtu.be", ""): return "youtube.com"
+    return ".".join(host.split(".")[-2:])
+
+
+async def resolve_stream(extractors, url):
+    """Resolves a video's direct audio URL without downloading anything."""
+    info, _ = await extractors.extract('stream', url)
+    if not info.get('url'):
+        raise LookupError(f"No direct audio stream for {url}")
+    return info
+
+
+class DownloadJob:
+    """
+    One yt-dlp download, possibly shared by several requesters of the same video.
+    `await job.wait()` for (info, file_path); `cancel()` drops it.
+    """
+
+    def __init__(self, url, outtmpl, priority, group=None, title="", key=None):
+        self.url = url
+        self.outtmpl = outtmpl    # None = the default Singles template
+        self.priority = priority
+        self.groups = {group}     # e.g. guild ids, so !cancel can drop that guild's bulk jobs
+        self.title = title
+        self.key = key            # video id, for single-flight
+        self.host = host_of(url)
+        self.cancelled = False
+        self.future = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        # Shielded: one requester giving up must not cancel the download for the others
+        return await asyncio.shield(self.future)
+
+    def cancel(self):
+        """Cancels the job. A download already running finishes in its worker but its result is discarded."""
+        self.cancelled = True
+        if not self.future.done(): self.future.cancel()
+
+
+class DownloadScheduler:
+    """
+    Bounded pool of yt-dlp workers with a priority queue.
+    - Interactive jobs (a user waiting on one song) always go before bulk ones.
+    - Bulk jobs never take the last worker (nor the last per-host slot), so an
+      interactive job can start right away.
+    - Per host: at most `per_host` bulk downloads at once (+1 for interactive),
+      and bulk starts are spaced by a random `bulk_delay` (anti-bot protection
+      for playlist mirroring).
+    """
+
+    def __init__(self, extractors, workers=3, per_host=2, bulk_delay=(5, 15)):
+        self.extractors = extractors  # ExtractorPool doing the actual yt-dlp work
+        self.workers = workers
+        self.per_host = per_host
+        self.bulk_delay = bulk_delay
+        self._pending = []        # sorted [(priority, seq, job)]
+        self._seq = itertools.count()
+        self._running = {}        # host -> running count
+        self._running_bulk = 0
+        self._inflight = {}       # video id -> {outtmpl: job queued or running for it}
+        self._next_bulk = {}      # host -> earliest time for the next bulk start
+        self._cond = asyncio.Condition()
+        self._timer = None        # pending wake-up for a bulk job waiting on its host delay
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks: task.cancel()
+        self._tasks = []
+        for _, _, job in self._pending: job.cancel()
+        self._pending.clear()
+
+    def submit(self, url, outtmpl=None, priority=INTERACTIVE, group=None, title="", key=None):
+        """
+        Queues a download. With a `key` (the video id), a request for a video that is
+        already queued or downloading joins that job instead of starting a second download,
+        and gets the same resulting path. A Singles request (no `outtmpl`) takes any copy;
+        a folder target only joins a job for that same folder (a playlist mirroring a song
+        just downloaded to Singles still gets its own file).
+        """
+        job = self._joinable(key, outtmpl) if key else None
+        if job:
+            job.groups.add(group)
+            if priority < job.priority and any(p[2] is job for p in self._pending):
+                # Someone is now waiting interactively: move it up the queue
+                self._pending = [p for p in self._pending if p[2] is not job]
+                job.priority = priority
+                bisect.insort(self._pending, (priority, next(self._seq), job))
+                asyncio.create_task(self._poke())
+            return job
+
+        job = DownloadJob(url, outtmpl, priority, group, title, key)
+        if key:
+            self._inflight.setdefault(key, {})[outtmpl] = job
+            job.future.add_done_callback(lambda _: self._forget(job))
+        bisect.insort(self._pending, (priority, next(self._seq), job))
+        asyncio.create_task(self._poke())
+        return job
+
+    def _joinable(self, key, outtmpl):
+        """The live job a request can share: same target first, any target for a Singles request."""
+        jobs = self._inflight.get(key, {})
+        options = [jobs.get(outtmpl)] + (list(jobs.values()) if outtmpl is None else [])
+        return next((job for job in options if job and not job.cancelled), None)
+
+    def _forget(self, job):
+        jobs = self._inflight.get(job.key, {})
+        if jobs.get(job.outtmpl) is job:
+            del jobs[job.outtmpl]
+            if not jobs: del self._inflight[job.key]
+
+    def cancel_group(self, group):
+        """
+        Drops a group from every pending bulk job and cancels the jobs nobody else is waiting for.
+        Interactive jobs are left alone: someone is waiting on that song right now.
+        Returns how many jobs were cancelled.
+        """
+        dropped = 0
+        for priority, _, job in self._pending:
+            if priority >= BULK and group in job.groups:
+                job.groups.discard(group)
+                if not job.groups:
+                    job.cancel()
+                    dropped += 1
+        self._pending = [p for p in self._pending if not p[2].cancelled]
+        return dropped
+
+    def pending_count(self, group=None):
+        return sum(1 for _, _, job in self._pending if group is None or group in job.groups)
+
+    async def _poke(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def _wake_later(self, delay):
+        loop = asyncio.get_running_loop()
+        if self._timer and self._timer.when() <= loop.time() + delay:
+            return
+        if self._timer: self._timer.cancel()
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        asyncio.create_task(self._poke())
+
+    def _pick(self):
+        """Pops the first runnable job, or returns None (the Condition keeps waiting)."""
+        now = time.monotonic()
+        for i, (priority, _, job) in enumerate(self._pending):
+            if job.cancelled:
+                continue
+            host_limit = self.per_host if priority >= BULK else self.per_host + 1
+            if self._running.get(job.host, 0) >= host_limit:
+                continue
+            if priority >= BULK:
+                if self._running_bulk >= max(self.workers - 1, 1):
+                    continue
+                wait = self._next_bulk.get(job.host, 0) - now
+                if wait > 0:
+                    self._wake_later(wait)
+                    continue
+                self._next_bulk[job.host] = now + random.uniform(*self.bulk_delay)
+            del self._pending[i]
+            return job
+        self._pending = [p for p in self._pending if not p[2].cancelled]
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                job = await self._cond.wait_for(self._pick)
+                self._running[job.host] = self._running.get(job.host, 0) + 1
+                if job.priority >= BULK: self._running_bulk += 1
+            try:
+                info, filename = await self.extractors.extract('download', job.url, True, job.outtmpl)
+                result = info, os.path.splitext(filename)[0] + ".opus"
+                if not job.future.done(): job.future.set_result(result)
+            except Exception as e:
+                if not job.future.done(): job.future.set_exception(e)
+            finally:
+                async with self._cond:
+                    self._running[job.host] -= 1
+                    if job.priority >= BULK: self._running_bulk -= 1
+                    self._cond.notify_all()
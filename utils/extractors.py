@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yt_dlp
+
+import config
+
+# One long-lived YoutubeDL per profile in every worker process
+PROFILES = {
+    'search': {'quiet': True, 'extract_flat': 'in_playlist', 'remote_components': ['ejs:github']},
+    'playlist': {'quiet': True, 'extract_flat': 'in_playlist', 'remote_components': ['ejs:github']},
+    'stream': config.YDL_STREAM_OPTIONS,
+    'download': config.YDL_OPTIONS,
+}
+
+_ydls = {}  # profile -> YoutubeDL, only populated inside worker processes
+
+
+def _init_worker():
+    """Runs once per worker process: builds every profile and loads extractors/cookies up front."""
+    for name, opts in PROFILES.items():
+        ydl = yt_dlp.YoutubeDL(dict(opts))
+        ydl.cookiejar  # reads cookies.txt now rather than on the first request
+        ydl.get_info_extractor('Youtube')
+        _ydls[name] = ydl
+
+
+def _warm():
+    return True
+
+
+def _extract(profile, url, download=False, outtmpl=None):
+    """Worker side: returns (sanitized info, prepared filename or None)."""
+    ydl = _ydls[profile]
+    default_tmpl = ydl.params['outtmpl']['default']
+    try:
+        if outtmpl: ydl.params['outtmpl']['default'] = outtmpl
+        info = ydl.extract_info(url, download=download)
+        if not info:
+            raise yt_dlp.utils.DownloadError(f"Nothing extracted for {url}")
+        filename = ydl.prepare_filename(info) if download else None
+        return ydl.sanitize_info(info), filename
+    except Exception as e:
+        # yt-dlp errors hold loggers and tracebacks that can't be pickled back to the bot process
+        raise yt_dlp.utils.DownloadError(str(e)) from None
+    finally:
+        ydl.params['outtmpl']['default'] = default_tmpl
+
+
+class ExtractorPool:
+    """
+    Pools of pre-initialized yt-dlp workers in separate processes.
+    Saves the per-request YoutubeDL setup (extractors, cookies, JS challenge
+    solver) and keeps the GIL-heavy extraction out of the bot process.
+    Downloads get their own `workers` (as many as the DownloadScheduler runs);
+    searches, playlist listings and stream URLs go to `lookup_workers`, so a
+    lookup never waits behind a download and its postprocessing.
+    """
+
+    def __init__(self, workers=3, lookup_workers=2):
+        self.sizes = {'download': workers, 'lookup': lookup_workers}  # 0 = that kind isn't used here
+        self._pools = {}  # 'download' / 'lookup' -> ProcessPoolExecutor
+
+    def start(self):
+        for kind, size in self.sizes.items():
+            if size: self._start(kind)
+
+    def _start(self, kind):
+        # spawn, not fork: forking the bot would copy its threads' locks (and the voice threads) mid-use
+        pool = self._pools[kind] = ProcessPoolExecutor(max_workers=self.sizes[kind], initializer=_init_worker,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(self.sizes[kind]):
+            pool.submit(_warm) # spawn the processes now, not on the first request
+
+    def stop(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+    async def extract(self, profile, url, download=False, outtmpl=None):
+        """Runs extract_info with the given profile. Returns (info, filename or None)."""
+        loop = asyncio.get_running_loop()
+        kind = 'download' if profile == 'download' else 'lookup'
+        pool = self._pools.get(kind)
+        if pool is None:
+            raise RuntimeError(f"No {kind} workers in this process")
+        try:
+            return await loop.run_in_executor(pool, _extract, profile, url, download, outtmpl)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OS): start a fresh pool and retry once.
+            # Only the first caller to notice restarts it, the others retry on the new pool
+            if self._pools.get(kind) is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._start(kind)
+            return await loop.run_in_executor(self._pools[kind], _extract, profile, url, download, outtmpl)
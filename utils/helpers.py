@@ -1,11 +1,7 @@
 import datetime
-import subprocess
 import asyncio
-import discord
 import os
-
-# Import configuration to access paths
-import config
+import discord
 
 def log_error(song_title, error_message):
     """Saves download failures to a text file for later review."""
@@ -13,14 +9,6 @@ def log_error(song_title, error_message):
     with open("error_log.txt", "a", encoding="utf-8") as f:
         f.write(f"[{timestamp}] SONG: {song_title} | ERROR: {error_message}\n")
 
-def get_duration(file_path):
-    """Uses your local ffprobe to get song length."""
-    try:
-        cmd = [config.FFPROBE_EXE, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", file_path]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        return float(result.stdout)
-    except: return 0
-
 def get_progress_bar(elapsed, total, bar_length=29): # Increased default to 28
     """Calculates bar size to match the width of Discord button rows."""
     if total <= 0: return "▬" * bar_length
@@ -31,6 +19,13 @@ def get_progress_bar(elapsed, total, bar_length=29): # Increased default to 28
     bar = "━" * filled_length + "🔘" + "▬" * (bar_length - filled_length)
     return bar
 
+def write_atomic(path, text):
+    """Replaces a file's contents via a temporary file, so a crash never leaves it half-written. Blocking."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
 def format_time(seconds):
     mins, secs = divmod(int(seconds), 60)
     return f"{mins}:{secs:02}"
@@ -0,0 +1,196 @@
+"""
+Batch import of an existing collection (MP3, FLAC, M4A...) into the library:
+
+    python -m utils.importer "D:/Music/Old CDs"                  # one library folder per source folder
+    python -m utils.importer "D:/Music/Old CDs" --folder "Old CDs" --workers 8
+
+Files are transcoded by ffmpeg, one per worker process, into 48 kHz stereo Ogg/Opus with
+20ms frames (what OggOpusSource plays without ffmpeg) and named 'title [id].opus' with
+an id derived from a hash of the source. Re-runs skip unchanged sources by mtime and
+already imported content by hash. Run it with the bot stopped, or use !import.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from utils.helpers import write_atomic
+
+AUDIO_EXTS = {'.mp3', '.flac', '.m4a', '.aac', '.ogg', '.opus', '.wav', '.wma', '.webm', '.mka'}
+BITRATE = 160  # kbps, plenty for voice chat playback
+
+
+def content_id(path):
+    """11-character id from the file's bytes, shaped like a YouTube id so the index picks it up from the name."""
+    digest = hashlib.blake2b(digest_size=9)
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return base64.urlsafe_b64encode(digest.digest()).decode()[:11]
+
+
+def safe_name(name):
+    # Same rule as playlist folders, keeps names valid on Windows
+    return "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
+
+
+def transcode(src, dst):
+    """Worker side: ffmpeg src -> dst (Ogg/Opus, passthrough-ready). Returns the metadata the index stores."""
+    tmp = dst + ".part"  # not .opus, so a library scan never picks up a half-written file
+    cmd = [config.FFMPEG_EXE, "-nostdin", "-v", "error", "-y", "-i", src,
+           "-map", "0:a:0", "-vn", "-map_metadata", "0",
+           "-c:a", "libopus", "-b:a", f"{BITRATE}k", "-ar", "48000", "-ac", "2",
+           "-frame_duration", "20", "-application", "audio", "-f", "ogg", tmp]
+    result = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    if result.returncode != 0:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"ffmpeg exited {result.returncode}")
+    os.replace(tmp, dst)
+
+    probe = subprocess.run([config.FFPROBE_EXE, "-v", "error", "-show_entries", "format=duration",
+                            "-of", "json", dst], capture_output=True, text=True)
+    try:
+        duration = float(json.loads(probe.stdout)['format']['duration'])
+    except (ValueError, KeyError):
+        return None  # MetadataService probes it on first play instead
+    return {'duration': duration, 'codec': 'opus', 'sample_rate': 48000, 'channels': 2, 'bitrate': BITRATE}
+
+
+class Importer:
+    """
+    Imports a source tree into the library. Hashing and transcoding run in a process
+    pool; the results are registered in the index in one batch (no rescan).
+    `seen` remembers every source as [mtime, size, id] so unchanged files aren't even re-hashed.
+    """
+
+    def __init__(self, index, state_path=None, workers=None):
+        self.index = index
+        self.state_path = state_path
+        self.workers = workers or os.cpu_count() or 1
+        self.seen = {}  # abs source path -> [mtime, size, id]
+
+    def load(self):
+        if not self.state_path: return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.seen = json.load(f)
+        except (OSError, ValueError):
+            self.seen = {}
+
+    def save(self):
+        if not self.state_path: return
+        write_atomic(self.state_path, json.dumps(self.seen))
+
+    @staticmethod
+    def scan(source):
+        """[(abs path, mtime, size)] of every audio file under source. Blocking."""
+        found = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTS:
+                    path = os.path.abspath(os.path.join(root, name))
+                    st = os.stat(path)
+                    found.append((path, st.st_mtime, st.st_size))
+        return found
+
+    def target(self, source, path, vid, folder=None):
+        """Library path for an imported file: one folder per source folder unless `folder` is given."""
+        if not folder:
+            rel = os.path.relpath(os.path.dirname(path), source)
+            parts = [os.path.basename(os.path.abspath(source))] + ([] if rel == '.' else rel.split(os.sep))
+            folder = " - ".join(parts)
+        title = safe_name(os.path.splitext(os.path.basename(path))[0]) or vid
+        return os.path.join(self.index.root, safe_name(folder), f"{title} [{vid}].opus")
+
+    def imported(self, vid):
+        return self.index.get_by_id(vid) is not None
+
+    async def run(self, source, folder=None, progress=None):
+        """
+        Imports everything new under `source`. `progress(done, total)` is called as
+        transcodes finish. Returns (converted entries, skipped count, [(source, error)]).
+        """
+        loop = asyncio.get_running_loop()
+        source = os.path.abspath(source)
+        await asyncio.to_thread(self.load)
+        files = await asyncio.to_thread(self.scan, source)
+
+        # Unchanged since the last run and still in the library: nothing to read
+        todo = [(p, m, s) for p, m, s in files
+                if not (self.seen.get(p, [None])[:2] == [m, s] and self.imported(self.seen[p][2]))]
+        skipped = len(files) - len(todo)
+        failed = []
+        # spawn, not fork: !import runs this inside the bot, next to the voice and updater threads
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            ids = await asyncio.gather(*(loop.run_in_executor(pool, content_id, p) for p, _, _ in todo),
+                                       return_exceptions=True)
+            jobs, claimed = {}, set()
+            for (path, mtime, size), vid in zip(todo, ids):
+                if isinstance(vid, Exception):
+                    failed.append((path, str(vid)))
+                    continue
+                self.seen[path] = [mtime, size, vid]
+                if self.imported(vid) or vid in claimed:
+                    skipped += 1  # same content already in the library (or twice in this source)
+                    continue
+                claimed.add(vid)
+                dst = self.target(source, path, vid, folder)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                jobs[loop.run_in_executor(pool, transcode, path, dst)] = (path, dst)
+
+            done = 0
+            for future in asyncio.as_completed(list(jobs)):
+                try:
+                    await future
+                except Exception:
+                    pass  # collected below, with the file it belongs to
+                done += 1
+                if progress: await progress(done, len(jobs))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True) # not the with-block's join, that would block the loop
+
+        results = []
+        for future, (path, dst) in jobs.items():
+            if future.exception():
+                failed.append((path, str(future.exception())))
+                del self.seen[path]  # retried next run
+            else:
+                results.append((dst, future.result()))
+        converted = self.index.add_many(results)
+        await asyncio.to_thread(self.save)
+        return converted, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="folder to import (scanned recursively)")
+    parser.add_argument("--folder", help="put everything in this library folder")
+    parser.add_argument("--workers", type=int, default=None, help="ffmpeg processes (default: one per core)")
+    args = parser.parse_args()
+
+    from utils.library_index import LibraryIndex
+    index = LibraryIndex(config.MUSIC_FOLDER)
+    index.open_snapshot(config.INDEX_DB)
+    importer = Importer(index, config.IMPORT_STATE, args.workers)
+
+    async def progress(done, total):
+        if done % 25 == 0 or done == total: print(f"  {done}/{total} transcoded")
+
+    converted, skipped, failed = asyncio.run(importer.run(args.source, args.folder, progress))
+    print(f"Imported {len(converted)} songs, skipped {skipped}, failed {len(failed)}")
+    for path, error in failed:
+        print(f"  FAILED {path}: {error}")
+
+
+if __name__ == "__main__":
+    main()
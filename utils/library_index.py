@@ -0,0 +1,436 @@
+import asyncio
+import itertools
+import os
+import pathlib
+import re
+import sqlite3
+import time
+from array import array
+
+from utils.ngram_index import NgramIndex
+
+# yt-dlp names files '%(title)s [%(id)s].opus', so the id is always the last bracket
+VIDEO_ID_RE = re.compile(r"\[([A-Za-z0-9_-]{11})\]$")
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+TRACK_FIELDS = ('path', 'title', 'id', 'folder', 'mtime', 'size',
+                'duration', 'codec', 'sample_rate', 'channels', 'bitrate', 'meta_mtime')
+META_FIELDS = TRACK_FIELDS[6:]
+SCHEMA_VERSION = 2  # bump when TRACK_FIELDS changes; old snapshots are dropped and rescanned
+APPLY_CHUNK = 250   # files apply_changes_async() inserts between two yields to the loop (~10ms)
+
+
+def normalize_title(title):
+    """Lowercase, drop the ' [videoid]' suffix and collapse punctuation, for fuzzy matching."""
+    title = VIDEO_ID_RE.sub("", title)
+    return NON_WORD_RE.sub(" ", title).lower().strip()
+
+
+class LibraryIndex:
+    """
+    In-memory index of every .opus file in the library.
+    Keeps dict lookups by path, by YouTube id and by folder so single
+    downloads can be added/removed without walking the whole tree again.
+    When a snapshot is open, every change is also written through to SQLite
+    so the next boot can load the index instead of rescanning.
+    A read-only snapshot (shard processes, see launcher.py) is never written:
+    plays, probed metadata and seek indexes go to `forward` instead, for the
+    one process that owns the file.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.by_path = {}    # abs path -> entry
+        self.by_id = {}      # video id -> {path: entry} (same video can live in several folders)
+        self.by_folder = {}  # folder name (relative to root) -> {path: entry}
+        self.dir_mtimes = {} # folder name -> directory mtime at last scan
+        self.last_played = {} # abs path -> time.time() it last started playing
+        self.grams = NgramIndex()         # trigram prefilter over normalized titles (keyed by path)
+        self.folder_grams = NgramIndex()  # same for folder names (keyed by folder)
+        self.folder_keys = {}             # normalized folder name -> folder
+        self._listings = {}  # folder -> entries sorted by path, rebuilt lazily after that folder changes
+        self._top_folders = None
+        self.db = None
+        self.readonly = False
+        self.forward = None  # callable(op, *args) taking the writes of a read-only snapshot
+        self.version = 0     # bumped on every change so derived structures know to refresh
+        self._batch_depth = 0
+
+    def __iter__(self):
+        return iter(list(self.by_path.values()))
+
+    def __len__(self):
+        return len(self.by_path)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.by_path
+
+    def make_entry(self, path, mtime=None, size=None):
+        path = os.path.abspath(path)
+        if mtime is None:
+            try:
+                st = os.stat(path)
+                mtime, size = st.st_mtime, st.st_size
+            except OSError:
+                mtime, size = 0, 0
+        title = os.path.basename(path)[:-5]
+        match = VIDEO_ID_RE.search(title)
+        folder = os.path.relpath(os.path.dirname(path), self.root)
+        entry = {'title': title, 'path': path,
+                 'id': match.group(1) if match else None, 'folder': folder,
+                 'mtime': mtime, 'size': size}
+        entry.update(dict.fromkeys(META_FIELDS))
+        return entry
+
+    def _insert(self, entry):
+        if entry['path'] in self.by_path:
+            self._discard(entry['path'])
+        entry['norm'] = normalize_title(entry['title'])
+        self.version += 1
+        self._listings.pop(entry['folder'], None)
+
+        self.by_path[entry['path']] = entry
+        self.grams.add(entry['path'], entry['norm'])
+        if entry['folder'] not in self.by_folder and entry['folder'] != '.':
+            self._top_folders = None
+            folder_norm = normalize_title(os.path.basename(entry['folder']))
+            self.folder_grams.add(entry['folder'], folder_norm)
+            self.folder_keys.setdefault(folder_norm, entry['folder'])
+        self.by_folder.setdefault(entry['folder'], {})[entry['path']] = entry
+        if entry['id']:
+            self.by_id.setdefault(entry['id'], {})[entry['path']] = entry
+
+    def _discard(self, path):
+        entry = self.by_path.pop(path, None)
+        if not entry:
+            return None
+        self.version += 1
+        self._listings.pop(entry['folder'], None)
+        self.grams.remove(path)
+
+        for table, key in ((self.by_folder, entry['folder']), (self.by_id, entry['id'])):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.pop(entry['path'], None)
+                if not bucket: del table[key]
+
+        if entry['folder'] not in self.by_folder and entry['folder'] in self.folder_grams.texts:
+            folder_norm = self.folder_grams.texts[entry['folder']]
+            self.folder_grams.remove(entry['folder'])
+            if self.folder_keys.get(folder_norm) == entry['folder']:
+                del self.folder_keys[folder_norm]
+            self._top_folders = None
+        return entry
+
+    def add(self, path, mtime=None, size=None):
+        """Adds (or refreshes) a single file and returns its entry."""
+        entry = self.make_entry(path, mtime, size)
+        self._insert(entry)
+        self.persist(entry)
+        return entry
+
+    def add_many(self, files):
+        """
+        Registers files written outside a scan (e.g. by the importer) in one transaction.
+        `files` is [(path, meta or None)], meta as MetadataService stores it. Returns the entries.
+        """
+        entries = []
+        self._batch_depth += 1
+        try:
+            for path, meta in files:
+                entry = self.make_entry(path)
+                if meta: entry.update(meta, meta_mtime=entry['mtime'])
+                self._insert(entry)
+                self.persist(entry)
+                entries.append(entry)
+            # Those folders only changed because of these files: the next sync can trust them
+            for folder in {e['folder'] for e in entries}:
+                try:
+                    self.dir_mtimes[folder] = os.stat(os.path.join(self.root, folder)).st_mtime
+                except OSError:
+                    continue
+                if self.db and not self.readonly:
+                    self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (folder, self.dir_mtimes[folder]))
+            self._top_folders = None
+        finally:
+            self._batch_depth -= 1
+        self._commit()
+        return entries
+
+    def remove(self, path):
+        """Drops a single file from the index; returns the removed entry or None."""
+        entry = self._discard(os.path.abspath(path))
+        if entry:
+            self.last_played.pop(entry['path'], None)
+        if entry and self.db and not self.readonly:
+            self.db.execute("DELETE FROM tracks WHERE path = ?", (entry['path'],))
+            self.db.execute("DELETE FROM seek_index WHERE path = ?", (entry['path'],))
+            self.db.execute("DELETE FROM plays WHERE path = ?", (entry['path'],))
+            self._commit()
+        return entry
+
+    def touch(self, path, when=None):
+        """Records that a library file just started playing (drives Singles eviction)."""
+        path = os.path.abspath(path)
+        if path not in self.by_path: return
+        self.last_played[path] = when or time.time()
+        if self.readonly:
+            self._forward('touch', path, self.last_played[path])
+        elif self.db:
+            self.db.execute("INSERT OR REPLACE INTO plays VALUES (?, ?)", (path, self.last_played[path]))
+            self._commit()
+
+    def get_by_id(self, video_id):
+        copies = self.by_id.get(video_id)
+        return next(iter(copies.values())) if copies else None
+
+    def get_by_path(self, path):
+        return self.by_path.get(os.path.abspath(path))
+
+    def folder(self, name):
+        """Returns the entries of one folder (empty list if unknown)."""
+        return list(self.by_folder.get(name, {}).values())
+
+    def listing(self, name):
+        """Entries of one folder sorted by path, the order the library browser shows. Cached until the folder changes."""
+        listing = self._listings.get(name)
+        if listing is None:
+            listing = sorted(self.by_folder.get(name, {}).values(), key=lambda e: e['path'])
+            self._listings[name] = listing
+        return listing
+
+    def top_folders(self):
+        """Sorted names of the folders directly under the library root."""
+        if self._top_folders is None:
+            names = {f.split(os.sep)[0] for f in itertools.chain(self.dir_mtimes, self.by_folder) if f != '.'}
+            self._top_folders = sorted(names)
+        return self._top_folders
+
+    def find_folder(self, query):
+        """Exact (case/punctuation-insensitive) folder match, or None."""
+        return self.folder_keys.get(normalize_title(query))
+
+    async def build_grams(self):
+        """Builds the title trigrams a snapshot load deferred, on a worker thread."""
+        await self.grams.build_in_thread()
+
+    def candidates(self, query, limit=300):
+        """Entries most likely to fuzzy-match the normalized query, via the trigram index."""
+        return [self.by_path[p] for p in self.grams.candidates(query, limit)]
+
+    def prefix(self, query, limit=25):
+        """Entries whose normalized title starts with the normalized query."""
+        return [self.by_path[p] for p in self.grams.prefix(normalize_title(query), limit)]
+
+    def clear(self):
+        self.grams.clear()
+        self.folder_grams.clear()
+        self.folder_keys.clear()
+        self.by_path.clear()
+        self.by_id.clear()
+        self.by_folder.clear()
+        self.dir_mtimes.clear()
+        self._listings.clear()
+        self._top_folders = None
+        self.version += 1
+
+    def rebuild(self):
+        """Full walk of the library. Blocking, prefer running scan_changes() in a thread."""
+        self.clear()
+        self.apply_changes(self.scan_changes({}, {}))
+
+    def apply_remote(self, added, removed):
+        """Changes another process already wrote to the shared snapshot: memory only. Same format as scan_changes."""
+        for path in removed:
+            if self._discard(path): self.last_played.pop(path, None)
+        for path, mtime, size in added:
+            entry = self.by_path.get(path)
+            if not entry or entry['mtime'] != mtime:
+                self._insert(self.make_entry(path, mtime, size))
+
+    # --- Snapshot (SQLite) ---
+    def open_snapshot(self, db_path, readonly=False):
+        """
+        Opens the on-disk snapshot and loads it. Returns the number of tracks loaded.
+        Can run in a worker thread as long as nothing else uses the index yet.
+        """
+        if self.db:
+            return len(self)
+        if readonly: # WAL lets any number of readers share the file with its single writer
+            self.db = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True,
+                                      check_same_thread=False)
+            self.readonly = True
+            self._load()
+            return len(self)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS tracks")
+            self.db.execute("DROP TABLE IF EXISTS dirs")
+            self.db.execute("DROP TABLE IF EXISTS seek_index")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS tracks ({', '.join(TRACK_FIELDS)}, PRIMARY KEY (path))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs (folder PRIMARY KEY, mtime)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seek_index (path PRIMARY KEY, mtime, granules, offsets)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS plays (path PRIMARY KEY, last_played)")
+        self.db.commit()
+        self._load()
+        return len(self)
+
+    def _load(self):
+        # Postings are built by build_grams(), so loading stays a plain dict fill
+        self.grams.defer()
+        for row in self.db.execute(f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks"):
+            self._insert(dict(zip(TRACK_FIELDS, row)))
+        self.dir_mtimes = dict(self.db.execute("SELECT folder, mtime FROM dirs"))
+        self._top_folders = None
+        self.last_played.update(self.db.execute("SELECT path, last_played FROM plays"))
+
+    def persist(self, entry):
+        """Writes one entry through to the snapshot (e.g. after its duration was probed)."""
+        if self.readonly:
+            self._forward('persist', tuple(entry[f] for f in TRACK_FIELDS))
+        elif self.db:
+            self.db.execute(f"INSERT OR REPLACE INTO tracks VALUES ({', '.join('?' * len(TRACK_FIELDS))})",
+                            tuple(entry[f] for f in TRACK_FIELDS))
+            self._commit()
+
+    def persist_many(self, entries):
+        """persist() for a batch of entries, in one statement."""
+        if self.readonly:
+            for entry in entries: self.persist(entry)
+        elif self.db:
+            self.db.executemany(f"INSERT OR REPLACE INTO tracks VALUES ({', '.join('?' * len(TRACK_FIELDS))})",
+                                [tuple(entry[f] for f in TRACK_FIELDS) for entry in entries])
+            self._commit()
+
+    def load_seek_index(self, path, mtime):
+        """Cached Ogg page index (granules, offsets) for a file, if still valid for this mtime."""
+        if not self.db: return None
+        row = self.db.execute("SELECT mtime, granules, offsets FROM seek_index WHERE path = ?",
+                              (os.path.abspath(path),)).fetchone()
+        if not row or row[0] != mtime: return None
+        return array('q', row[1]), array('q', row[2])
+
+    def save_seek_index(self, path, mtime, seek_index):
+        if self.readonly:
+            self._forward('seek_index', os.path.abspath(path), mtime, seek_index)
+        elif self.db:
+            granules, offsets = seek_index
+            self.db.execute("INSERT OR REPLACE INTO seek_index VALUES (?, ?, ?, ?)",
+                            (os.path.abspath(path), mtime, granules.tobytes(), offsets.tobytes()))
+            self._commit()
+
+    def _forward(self, op, *args):
+        if self.forward: self.forward(op, *args)
+
+    def _commit(self):
+        if self.db and not self._batch_depth:
+            self.db.commit()
+
+    # --- Background sync ---
+    def sync_snapshot(self):
+        """Copies what scan_changes needs, so the scan can run in a thread while the loop keeps mutating."""
+        known_files = {folder: {p: e['mtime'] for p, e in files.items()}
+                       for folder, files in self.by_folder.items()}
+        return dict(self.dir_mtimes), known_files
+
+    def scan_changes(self, known_dirs, known_files):
+        """
+        Walks the tree comparing directory mtimes with the snapshot.
+        Only directories whose mtime moved get listed, the rest are trusted.
+        Returns (added [(path, mtime, size)], removed [path], dir_mtimes).
+        """
+        added, removed, dir_mtimes = [], [], {}
+        children = {}
+        for folder in known_dirs:
+            if folder != '.':
+                children.setdefault(os.path.dirname(folder) or '.', []).append(folder)
+
+        stack = ['.']
+        while stack:
+            folder = stack.pop()
+            full = os.path.normpath(os.path.join(self.root, folder))
+            try:
+                mtime = os.stat(full).st_mtime
+            except OSError:
+                continue
+            dir_mtimes[folder] = mtime
+
+            if known_dirs.get(folder) == mtime:
+                stack.extend(children.get(folder, []))
+                continue
+
+            listed = {}
+            with os.scandir(full) as it:
+                for e in it:
+                    if e.is_dir():
+                        stack.append(os.path.relpath(e.path, self.root))
+                    elif e.name.endswith(".opus"):
+                        st = e.stat()
+                        listed[os.path.abspath(e.path)] = (st.st_mtime, st.st_size)
+
+            known = known_files.get(folder, {})
+            removed.extend(p for p in known if p not in listed)
+            added.extend((p, m, s) for p, (m, s) in listed.items() if known.get(p) != m)
+
+        # Folders that disappeared entirely
+        for folder in known_files:
+            if folder not in dir_mtimes:
+                removed.extend(known_files[folder])
+        return added, removed, dir_mtimes
+
+    def apply_changes(self, changes):
+        """Applies a scan_changes() result in one go. Blocking on big changes, prefer apply_changes_async()."""
+        added, removed, dir_mtimes = changes
+        for _ in self._apply(removed, self.make_entries(added), dir_mtimes): pass
+        return len(added), len(removed)
+
+    async def apply_changes_async(self, changes, chunk=APPLY_CHUNK):
+        """
+        apply_changes() with the entries built on a worker thread, then inserted and
+        committed `chunk` at a time, yielding to the loop in between. A big batch defers
+        the title trigrams and builds them in a thread after (if they were deferred
+        already, whoever deferred them builds them).
+        """
+        added, removed, dir_mtimes = changes
+        entries = await asyncio.to_thread(self.make_entries, added)
+        bulk = len(added) > chunk * 4 and not self.grams.deferred
+        if bulk: self.grams.defer()
+        steps = self._apply(removed, entries, dir_mtimes, chunk)
+        try:
+            for _ in steps:
+                if self.db and not self.readonly: self.db.commit()
+                await asyncio.sleep(0)
+        finally:
+            steps.close()
+        if bulk: await self.build_grams()
+        return len(added), len(removed)
+
+    def make_entries(self, files):
+        """make_entry() for each (path, mtime, size). Touches no shared state, so it can run in a thread."""
+        return [self.make_entry(path, mtime, size) for path, mtime, size in files]
+
+    def _apply(self, removed, entries, dir_mtimes, chunk=None):
+        """Generator doing the work of apply_changes, pausing every `chunk` files (never if None)."""
+        self._batch_depth += 1
+        try:
+            for n, path in enumerate(removed, 1):
+                self.remove(path)
+                if chunk and n % chunk == 0: yield
+            step = chunk or len(entries) or 1
+            for i in range(0, len(entries), step):
+                batch = entries[i:i + step]
+                for entry in batch: self._insert(entry)
+                self.persist_many(batch)
+                if chunk: yield
+            self.dir_mtimes = dir_mtimes
+            self._top_folders = None
+            if self.db and not self.readonly:
+                self.db.execute("DELETE FROM dirs")
+                self.db.executemany("INSERT INTO dirs VALUES (?, ?)", dir_mtimes.items())
+        finally:
+            self._batch_depth -= 1
+        self._commit()
@@ -0,0 +1,100 @@
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from utils.helpers import write_atomic
+
+# What process_youtube_logic actually reads from a lookup; the rest of yt-dlp's info is dropped
+INFO_KEYS = ('_type', 'id', 'title', 'webpage_url')
+ENTRY_KEYS = ('id', 'title', 'url')
+
+
+def search_key(query):
+    return "search:" + " ".join(query.lower().split())
+
+
+def link_key(url):
+    """Same playlist/video -> same key, whatever the link form (youtu.be, &index=, si=...)."""
+    if not url.startswith(("http://", "https://")): url = "https://" + url
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query)
+    host = (parsed.hostname or "").lower()
+    if "list" in params:
+        return "list:" + params["list"][0]
+    if host == "youtu.be":
+        return "video:" + parsed.path.strip("/")
+    if "v" in params:
+        return "video:" + params["v"][0]
+    return "url:" + host + parsed.path
+
+
+def slim_info(info):
+    """Keeps only the fields we use, so cached playlists stay small in memory and on disk."""
+    slim = {k: info[k] for k in INFO_KEYS if k in info}
+    if 'entries' in info:
+        slim['entries'] = [{k: e[k] for k in ENTRY_KEYS if k in e} if e else None for e in info['entries']]
+    return slim
+
+
+class LookupCache:
+    """
+    Bounded LRU of extract_info results (search results, flat playlists, video links),
+    each entry expiring after its own TTL. With a `path`, `save()` writes it to disk
+    and it is reloaded on the next start.
+    """
+
+    def __init__(self, max_entries=256, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.dirty = False
+        self._items = OrderedDict()  # key -> (expires at (wall clock), slimmed info)
+        if path: self.load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._items[key]
+            self.dirty = True
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key, info, ttl):
+        self._items[key] = (time.time() + ttl, slim_info(info))
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        self.dirty = True
+
+    def invalidate(self, key):
+        if self._items.pop(key, None) is not None:
+            self.dirty = True
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (expires, info) in data:  # stored oldest -> newest
+            if expires > now:
+                self._items[key] = (expires, info)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def snapshot(self):
+        """Entries as save() stores them. Clears `dirty`."""
+        self.dirty = False
+        return [[key, list(item)] for key, item in self._items.items()]
+
+    def save(self, snapshot=None):
+        if not self.path: return
+        if snapshot is None: snapshot = self.snapshot()
+        write_atomic(self.path, json.dumps(snapshot))
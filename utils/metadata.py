@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+
+import config
+
+
+class MetadataService:
+    """
+    Async ffprobe wrapper. Probes run as subprocesses (never on the event loop),
+    at most `max_procs` at a time, and results are stored on the library index
+    entry keyed by the file's mtime so each file is probed once.
+    """
+
+    def __init__(self, index, max_procs=4):
+        self.index = index
+        self.max_procs = max_procs
+        self._sem = None
+        self._inflight = {}  # path -> Task, so concurrent asks share one probe
+        self._extra = {}     # (path, mtime) -> meta for files outside the index
+
+    async def get(self, path):
+        """Returns {'duration', 'codec', 'sample_rate', 'channels', 'bitrate'} for a file."""
+        entry = self.index.get_by_path(path)
+        if entry and entry['duration'] is not None and entry['meta_mtime'] == entry['mtime']:
+            return self._pick(entry)
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = 0
+        if not entry and (path, mtime) in self._extra:
+            return self._extra[(path, mtime)]
+
+        if path not in self._inflight:
+            self._inflight[path] = asyncio.create_task(self.probe(path))
+        try:
+            meta = await asyncio.shield(self._inflight[path])
+        finally:
+            self._inflight.pop(path, None)
+
+        entry = self.index.get_by_path(path)
+        if not meta['codec']:
+            return meta  # probe failed, don't cache it
+        if entry:
+            entry.update(meta, meta_mtime=entry['mtime'])
+            self.index.persist(entry)
+        else:
+            self._extra[(path, mtime)] = meta
+        return meta
+
+    async def probe(self, path):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_procs)
+        cmd = [config.FFPROBE_EXE, "-v", "error", "-select_streams", "a:0",
+               "-show_entries", "format=duration,bit_rate:stream=codec_name,sample_rate,channels",
+               "-of", "json", path]
+        async with self._sem:
+            proc = None
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+                out, _ = await asyncio.wait_for(proc.communicate(), timeout=20)
+                data = json.loads(out or b"{}")
+            except (Exception, asyncio.CancelledError) as e:
+                if proc and proc.returncode is None: # timed out or cancelled: don't leave ffprobe running
+                    proc.kill()
+                    await proc.wait()
+                if isinstance(e, asyncio.CancelledError): raise
+                data = {}
+
+        fmt = data.get('format', {})
+        stream = (data.get('streams') or [{}])[0]
+        return {
+            'duration': float(fmt.get('duration') or 0),
+            'codec': stream.get('codec_name'),
+            'sample_rate': int(stream.get('sample_rate') or 0),
+            'channels': int(stream.get('channels') or 0),
+            'bitrate': round(int(fmt.get('bit_rate') or 0) / 1000),
+        }
+
+    @staticmethod
+    def _pick(entry):
+        return {k: entry[k] for k in ('duration', 'codec', 'sample_rate', 'channels', 'bitrate')}
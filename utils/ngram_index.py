@@ -0,0 +1,128 @@
+import asyncio
+import bisect
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+
+def trigrams(text):
+    """Character trigrams of an already normalized string, padded so word starts count too."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NgramIndex:
+    """
+    Inverted trigram index: gram -> set of keys.
+    Used to cut the library down to a few hundred likely titles before
+    they go through rapidfuzz, and for prefix lookups (autocomplete).
+    Bulk loads can defer() the postings: only `texts` is kept up to date until
+    build_in_thread() (or, as a last resort, the first lookup) catches up.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.texts = {}          # key -> normalized text
+        self._sorted = []        # [(text, key)] for prefix lookups, kept sorted
+        self.deferred = False
+        self._building = None    # task of a running build_in_thread()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, key, text):
+        if key in self.texts:
+            self.remove(key)
+        self.texts[key] = text
+        if self.deferred: return
+        for gram in trigrams(text):
+            self.postings.setdefault(gram, set()).add(key)
+        bisect.insort(self._sorted, (text, key))
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None or self.deferred:
+            return
+        for gram in trigrams(text):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys: del self.postings[gram]
+        i = bisect.bisect_left(self._sorted, (text, key))
+        if i < len(self._sorted) and self._sorted[i] == (text, key):
+            del self._sorted[i]
+
+    def clear(self):
+        self.postings = {}
+        self.texts.clear()
+        self._sorted = []
+        self.deferred = False
+
+    def defer(self):
+        """Stops maintaining postings and the prefix list, for loading many keys at once."""
+        self.deferred = True
+        self.postings = {}
+        self._sorted = []
+
+    @staticmethod
+    def _build(texts):
+        postings = {}
+        for key, text in texts.items():
+            for gram in trigrams(text):
+                postings.setdefault(gram, set()).add(key)
+        return postings, sorted((text, key) for key, text in texts.items())
+
+    def _install(self, texts, postings, ordered):
+        """Swaps in structures built from `texts`, then replays what changed since that copy."""
+        if not self.deferred: return
+        current, self.texts = self.texts, texts
+        self.postings, self._sorted = postings, ordered
+        self.deferred = False
+        for key in [k for k in texts if k not in current]:
+            self.remove(key)
+        for key, text in current.items():
+            if texts.get(key) != text: self.add(key, text)
+
+    def build(self):
+        """Catches up a deferred index right here. Blocking, prefer build_in_thread()."""
+        if self.deferred:
+            texts = dict(self.texts)
+            self._install(texts, *self._build(texts))
+
+    async def build_in_thread(self):
+        """Builds the deferred postings on a worker thread; the loop only pays for the swap."""
+        if not self.deferred: return
+        if not self._building or self._building.done():
+            self._building = asyncio.ensure_future(self._build_later())
+        await asyncio.shield(self._building)
+
+    async def _build_later(self):
+        texts = dict(self.texts)  # the loop keeps mutating self.texts meanwhile
+        built = await asyncio.to_thread(self._build, texts)
+        self._install(texts, *built)
+
+    def candidates(self, query, limit=300):
+        """Keys sharing the most trigrams with the query, best first."""
+        self.build()
+        counts = Counter()
+        # Rarest grams first; grams shared by a big slice of the library are only
+        # used when nothing rarer matched (they add cost but barely any signal)
+        common = max(limit * 10, len(self.texts) // 10)
+        for keys in sorted((self.postings.get(g, ()) for g in trigrams(query)), key=len):
+            if not keys: continue
+            if len(keys) > common and counts: break
+            counts.update(keys)
+        if len(counts) <= limit:
+            return [k for k, _ in counts.most_common()]
+        return [k for k, _ in heapq.nlargest(limit, counts.items(), key=itemgetter(1))]
+
+    def prefix(self, prefix, limit=25):
+        """Keys whose text starts with `prefix`, in alphabetical order."""
+        self.build()
+        start = bisect.bisect_left(self._sorted, (prefix,))
+        found = []
+        for text, key in self._sorted[start:]:
+            if not text.startswith(prefix) or len(found) >= limit:
+                break
+            found.append(key)
+        return found
@@ -0,0 +1,174 @@
+import bisect
+import struct
+import threading
+from array import array
+from collections import deque
+import discord
+
+# capture, version, header type, granule, serial, sequence, crc, segment count
+PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+READ_BUFFER = 64 * 1024
+
+# Frame length (in tenths of ms) for each of the 32 Opus TOC configurations
+FRAME_TENTHS_MS = [100, 200, 400, 600] * 3 + [100, 200] * 2 + [25, 50, 100, 200] * 4
+
+
+class NotPassthrough(ValueError):
+    """The file can't be sent to Discord as-is and needs ffmpeg."""
+
+
+def packet_duration_ms(packet):
+    """Duration of an Opus packet from its TOC byte (RFC 6716, section 3.1)."""
+    if not packet: return 0
+    toc = packet[0]
+    frame = FRAME_TENTHS_MS[toc >> 3]
+    code = toc & 0x03
+    if code == 0: frames = 1
+    elif code in (1, 2): frames = 2
+    else: frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame * frames / 10
+
+
+class OggReader:
+    """Minimal Ogg demuxer: walks pages and reassembles the packets of the first logical stream."""
+
+    def __init__(self, file):
+        self.file = file
+        self.serial = None
+
+    def read_page(self):
+        """Returns (header_type, granule, segment table, body) or None at EOF."""
+        header = self.file.read(PAGE_HEADER.size)
+        if len(header) < PAGE_HEADER.size:
+            return None
+        capture, _, header_type, granule, serial, _, _, nsegs = PAGE_HEADER.unpack(header)
+        if capture != b"OggS":
+            raise NotPassthrough("Not an Ogg stream (bad page capture)")
+        table = self.file.read(nsegs)
+        body = self.file.read(sum(table))
+        if self.serial is None:
+            self.serial = serial
+        elif serial != self.serial:
+            return header_type, granule, b"", b""  # other logical stream, skip it
+        return header_type, granule, table, body
+
+    def iter_packets(self, skip_partial=False):
+        """Yields complete packets. `skip_partial` drops a packet continued from a previous page (after a seek)."""
+        partial, drop, first_page = b"", False, True
+        while True:
+            page = self.read_page()
+            if page is None:
+                return
+            header_type, _, table, body = page
+            if first_page:
+                drop, first_page = skip_partial and bool(header_type & 0x01), False
+
+            offset = 0
+            for lacing in table:
+                partial += body[offset:offset + lacing]
+                offset += lacing
+                if lacing < 255:
+                    if not drop: yield partial
+                    partial, drop = b"", False
+
+
+def build_seek_index(path, serial=None):
+    """
+    Reads only the page headers of a file and returns two parallel arrays:
+    the granule position (48kHz sample count) at the end of each page and
+    the byte offset where that page starts. Pages without a finished packet
+    (granule -1) and pages of other logical streams are left out.
+    """
+    granules, offsets = array('q'), array('q')
+    with open(path, "rb", buffering=READ_BUFFER) as f:
+        while True:
+            offset = f.tell()
+            header = f.read(PAGE_HEADER.size)
+            if len(header) < PAGE_HEADER.size:
+                break
+            capture, _, _, granule, page_serial, _, _, nsegs = PAGE_HEADER.unpack(header)
+            if capture != b"OggS":
+                break
+            body_len = sum(f.read(nsegs))
+            f.seek(body_len, 1)
+            if serial is None: serial = page_serial
+            if page_serial == serial and granule >= 0:
+                granules.append(granule)
+                offsets.append(offset)
+    return granules, offsets
+
+
+class OggOpusSource(discord.AudioSource):
+    """
+    Plays a 48 kHz Ogg/Opus file without ffmpeg: the Opus packets are read
+    straight from the container and handed to discord.py as-is.
+    Raises NotPassthrough if the file needs transcoding (codec, channel layout
+    or frame size Discord doesn't accept), so callers can fall back to FFmpeg.
+    """
+
+    def __init__(self, path, seek_index=None):
+        self.path = path
+        self.seek_index = seek_index  # (granules, offsets), built on first seek if not given
+        self._lock = threading.Lock()  # read() runs on the voice thread, seek() on a worker
+        self.file = open(path, "rb", buffering=READ_BUFFER)
+        try:
+            self.reader = OggReader(self.file)
+            self._packets = self.reader.iter_packets()
+            self.head = self._parse_head(next(self._packets, b""))
+            next(self._packets, None)  # OpusTags, not needed for playback
+            first = next(self._packets, b"")
+            if packet_duration_ms(first) != 20:
+                raise NotPassthrough("Opus frames are not 20ms")
+            self._buffer = deque([first])
+        except Exception:
+            self.file.close()
+            raise
+
+    @staticmethod
+    def _parse_head(packet):
+        if len(packet) < 19 or packet[:8] != b"OpusHead":
+            raise NotPassthrough("Not an Opus stream")
+        channels, pre_skip, rate, _, mapping = struct.unpack_from("<BHIhB", packet, 9)
+        if mapping != 0 or channels not in (1, 2) or rate not in (0, 48000):
+            raise NotPassthrough(f"Unsupported Opus layout ({channels}ch, {rate}Hz, mapping {mapping})")
+        return {'channels': channels, 'pre_skip': pre_skip, 'sample_rate': rate}
+
+    def prime(self, count=50):
+        """Reads the first `count` packets (~1s) ahead of time so playback starts from memory."""
+        with self._lock:
+            while len(self._buffer) < count:
+                packet = next(self._packets, b"")
+                if not packet: break
+                self._buffer.append(packet)
+
+    def seek(self, seconds):
+        """
+        Jumps to `seconds` into the track by binary searching the page index,
+        so the cost doesn't depend on how far in the target is.
+        Playback resumes at the start of the page holding that position.
+        """
+        if self.seek_index is None:
+            self.seek_index = build_seek_index(self.path, self.reader.serial)
+        granules, offsets = self.seek_index
+        target = self.head['pre_skip'] + int(max(seconds, 0) * 48000)
+        i = bisect.bisect_right(granules, target)
+
+        with self._lock:
+            self._buffer.clear()
+            if i >= len(offsets):
+                self._packets = iter(())  # past the end, read() returns b'' and the song finishes
+                return
+            self.file.seek(offsets[i])
+            self._packets = self.reader.iter_packets(skip_partial=True)
+
+    def read(self):
+        with self._lock:
+            if self._buffer:
+                return self._buffer.popleft()
+            return next(self._packets, b"")
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.file.close()
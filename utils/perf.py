@@ -0,0 +1,170 @@
+import asyncio
+import bisect
+import contextvars
+import threading
+import time
+
+from utils.helpers import write_atomic
+
+# Histogram bucket upper bounds, in seconds (Prometheus style, +Inf is implicit)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Hot-path stages, timed from the moment the interaction was received
+STAGES = ('search', 'download', 'source', 'first_packet')
+
+METRICS = {
+    'loop_lag': ('jukebox_loop_lag_seconds', "How late the event loop ran a timer that was due"),
+    'stage': ('jukebox_stage_seconds', "Time from interaction received to each playback stage"),
+}
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    @classmethod
+    def merge(cls, hists):
+        """One histogram summing several (e.g. a stage across every guild)."""
+        out = cls()
+        for hist in hists:
+            out.counts = [a + b for a, b in zip(out.counts, hist.counts)]
+            out.sum += hist.sum
+            out.count += hist.count
+            out.max = max(out.max, hist.max)
+        return out
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the overflow bucket)."""
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class Registry:
+    """Histograms keyed by (metric, labels). Observed from the loop and the voice threads."""
+
+    def __init__(self):
+        self.histograms = {}  # (metric, (('guild', gid), ('stage', name))) -> Histogram
+        self._lock = threading.Lock()
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def select(self, metric, **labels):
+        """Histograms of a metric whose labels include `labels`, as [(labels dict, Histogram)]."""
+        with self._lock:
+            items = list(self.histograms.items())
+        out = []
+        for (name, key), hist in items:
+            found = dict(key)
+            if name == metric and all(found.get(k) == v for k, v in labels.items()):
+                out.append((found, hist))
+        return out
+
+    def prometheus(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        for metric, (name, help_text) in METRICS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for labels, hist in sorted(self.select(metric), key=lambda x: sorted(x[0].items())):
+                base = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                sep = "," if base else ""
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ("+Inf",), hist.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+                suffix = f"{{{base}}}" if base else ""
+                lines.append(f"{name}_sum{suffix} {hist.sum:.6f}")
+                lines.append(f"{name}_count{suffix} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Writes the Prometheus text file atomically (for node_exporter's textfile collector). Blocking."""
+        write_atomic(path, self.prometheus())
+
+
+REGISTRY = Registry()
+
+
+class Trace:
+    """Stage timer for one user request. Each stage is recorded once, relative to when it was received."""
+
+    def __init__(self, gid):
+        self.gid = str(gid)
+        self.t0 = time.perf_counter()
+        self.seen = set()
+
+    def mark(self, stage):
+        if stage in self.seen: return
+        self.seen.add(stage)
+        REGISTRY.observe('stage', time.perf_counter() - self.t0, guild=self.gid, stage=stage)
+
+
+# The trace of the interaction being handled; tasks started from it inherit it
+_current = contextvars.ContextVar('trace', default=None)
+
+
+def begin(gid):
+    """Call when an interaction is received: later stages in this task (and its child tasks) are timed from here."""
+    trace = Trace(gid)
+    _current.set(trace)
+    return trace
+
+
+def mark(stage):
+    trace = _current.get()
+    if trace: trace.mark(stage)
+
+
+def on_first_packet(source):
+    """Marks 'first_packet' when the voice thread first reads from the source (if a trace is active)."""
+    trace = _current.get()
+    if not trace or 'first_packet' in trace.seen: return
+    read = source.read
+    def first_read():
+        data = read()
+        source.read = read
+        trace.mark('first_packet')
+        return data
+    source.read = first_read
+
+
+class LoopLagMonitor:
+    """Sleeps `interval` in a loop and records how late it wakes up: the time the loop was blocked."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task: self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            REGISTRY.observe('loop_lag', max(loop.time() - start - self.interval, 0))
@@ -0,0 +1,90 @@
+import json
+import os
+
+from utils.helpers import write_atomic
+
+MANIFEST_NAME = ".manifest.json"
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+class PlaylistManifest:
+    """
+    Per-playlist record of a mirror, stored in the playlist folder: every upstream
+    entry with its status and file. A re-run (after a restart or !cancel) only
+    downloads what is missing or failed, instead of going through yt-dlp again
+    for every track.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.source = None
+        self.title = ""
+        self.order = []    # video ids in upstream playlist order
+        self.tracks = {}   # video id -> {'id', 'title', 'url', 'status', 'file'}
+
+    @classmethod
+    def load(cls, folder):
+        """Reads the folder's manifest; a missing or corrupt one gives an empty manifest."""
+        manifest = cls(folder)
+        try:
+            with open(manifest.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        manifest.source = data.get('source')
+        manifest.title = data.get('title', "")
+        for track in data.get('tracks', []):
+            manifest.tracks[track['id']] = track
+            manifest.order.append(track['id'])
+        return manifest
+
+    def sync(self, source, title, entries):
+        """
+        Brings the manifest in line with the upstream entry list.
+        New videos come in as pending, videos gone upstream are dropped from the
+        manifest (their files stay in the folder). Returns (added, removed).
+        """
+        self.source, self.title = source, title
+        order, seen, added = [], set(), 0
+        for entry in entries:
+            if not entry or not entry.get('id') or entry['id'] in seen:
+                continue
+            vid = entry['id']
+            seen.add(vid)
+            order.append(vid)
+            track = self.tracks.get(vid)
+            if track is None:
+                self.tracks[vid] = {'id': vid, 'title': entry.get('title', 'Unknown Title'),
+                                    'url': entry.get('url') or f"https://www.youtube.com/watch?v={vid}",
+                                    'status': PENDING, 'file': None}
+                added += 1
+            elif entry.get('title'):
+                track['title'] = entry['title']
+        removed = [vid for vid in self.order if vid not in seen]
+        for vid in removed:
+            del self.tracks[vid]
+        self.order = order
+        return added, len(removed)
+
+    def __iter__(self):
+        return (self.tracks[vid] for vid in self.order)
+
+    def file_of(self, track):
+        """Absolute path of a finished track's file, or None."""
+        return os.path.normpath(os.path.join(self.folder, track['file'])) if track['file'] else None
+
+    def mark(self, vid, status, path=None):
+        track = self.tracks.get(vid)
+        if track is None: return
+        track['status'] = status
+        if path: track['file'] = os.path.relpath(path, self.folder)
+
+    def snapshot(self):
+        """Plain-data copy of the manifest, what save() writes."""
+        return {'source': self.source, 'title': self.title,
+                'tracks': [dict(track) for track in self]}
+
+    def save(self, snapshot=None):
+        if snapshot is None: snapshot = self.snapshot()
+        write_atomic(self.path, json.dumps(snapshot, indent=1))
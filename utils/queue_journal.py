@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from utils.helpers import write_atomic
+from utils.track_queue import Track
+
+
+def encode(track):
+    return [track.path, track.title, track.vid]
+
+
+def decode(item):
+    return Track(*item)
+
+
+class QueueJournal:
+    """
+    Append-only log (JSON lines) of every queue change and of what each guild is playing,
+    so queues survive a crash, a restart or a cog reload.
+    Each change costs one small append; once the log passes `compact_after` records it
+    is rewritten as a single snapshot per guild.
+    """
+
+    def __init__(self, path, compact_after=5000):
+        self.path = path
+        self.compact_after = compact_after
+        self.records = 0
+        self.closed = True
+        self._file = None
+        self._buffer = None  # appends made while a compaction is being written
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self.records += 1
+        if self._buffer is not None:
+            self._buffer.append(line)
+        elif self._file:
+            self._file.write(line)
+            self._file.flush()
+
+    # --- Recording ---
+    def queue_changed(self, gid, op, *args):
+        """TrackQueue.on_change hook."""
+        if op in ('add', 'reset'):
+            args = ([encode(t) for t in args[0]],)
+        self._write({'g': gid, 'op': op, 'a': args})
+
+    def now_playing(self, gid, track, pos=0, voice_id=None, text_id=None):
+        self._write({'g': gid, 'op': 'now', 't': encode(track) if track else None,
+                     'pos': round(pos, 1), 'vc': voice_id, 'tc': text_id})
+
+    def position(self, gid, pos):
+        self._write({'g': gid, 'op': 'pos', 'pos': round(pos, 1)})
+
+    # --- Replay ---
+    def load(self):
+        """Replays the log. Returns {gid: {'queue': [Track], 'now': {...} or None}}. Blocking."""
+        guilds = {}
+        try:
+            f = open(self.path, encoding="utf-8")
+        except OSError:
+            return guilds
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                self._apply(guilds.setdefault(record['g'], {'queue': [], 'now': None}), record)
+        return guilds
+
+    @staticmethod
+    def _apply(guild, record):
+        op, queue = record['op'], guild['queue']
+        args = record.get('a', ())
+        if op == 'snap':
+            guild['queue'] = [decode(t) for t in record['queue']]
+            guild['now'] = record['now']
+            if guild['now'] and guild['now']['t']: guild['now']['t'] = decode(guild['now']['t'])
+        elif op == 'add':
+            queue.extend(decode(t) for t in args[0])
+        elif op == 'reset':
+            guild['queue'] = [decode(t) for t in args[0]]
+        elif op == 'pop':
+            if queue: queue.pop(0)
+        elif op == 'clear':
+            queue.clear()
+        elif op == 'del':
+            if args[0] < len(queue): del queue[args[0]]
+        elif op == 'move':
+            if args[0] < len(queue): queue.insert(args[1], queue.pop(args[0]))
+        elif op == 'now':
+            guild['now'] = {k: record[k] for k in ('pos', 'vc', 'tc')}
+            guild['now']['t'] = decode(record['t']) if record['t'] else None
+        elif op == 'pos' and guild['now']:
+            guild['now']['pos'] = record['pos']
+
+    # --- Compaction ---
+    @staticmethod
+    def snapshot_record(gid, queue, now=None):
+        """One 'snap' record holding a guild's whole state. `now` is the dict written by now_playing."""
+        if now and now.get('t'): now = dict(now, t=encode(now['t']))
+        return {'g': gid, 'op': 'snap', 'queue': [encode(t) for t in queue], 'now': now}
+
+    async def compact(self, records):
+        """Replaces the log with `records` (one snapshot per guild, built on the loop)."""
+        if self._buffer is not None or self.closed: return  # already compacting, or closed
+        self._buffer = []
+        self._file.close() # Windows can't replace a file that is still open
+        self._file = None
+        try:
+            await asyncio.to_thread(self._rewrite, records)
+        finally:
+            buffered, self._buffer = self._buffer, None
+            self.records = len(records) + len(buffered)
+            if self.closed: # cog unloaded meanwhile: just flush what came in
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(buffered)
+            else:
+                self.open()
+                self._file.writelines(buffered)
+                self._file.flush()
+
+    def _rewrite(self, records):
+        write_atomic(self.path, "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
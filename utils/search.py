@@ -0,0 +1,87 @@
+import asyncio
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from utils.library_index import normalize_title
+
+
+# Past this many tracks the trigram index picks what gets scored
+CANDIDATE_LIMIT = 300
+
+
+class SearchEngine:
+    """
+    Fuzzy title search over the library index.
+    Small libraries are scored whole from a flat array of pre-normalized titles
+    (rebuilt only when the index changes); big ones are first narrowed down to
+    CANDIDATE_LIMIT titles by the index's trigram postings. Scoring runs in one
+    rapidfuzz call on a worker thread.
+    """
+
+    def __init__(self, index, scorer=fuzz.token_set_ratio, candidate_limit=CANDIDATE_LIMIT):
+        self.index = index
+        self.scorer = scorer
+        self.candidate_limit = candidate_limit
+        self._version = None
+        self._titles = []
+        self._entries = []
+
+    def refresh(self, query):
+        """Returns the (titles, entries) worth scoring for this query."""
+        if len(self.index) > self.candidate_limit:
+            entries = self.index.candidates(query, self.candidate_limit)
+            return [e['norm'] for e in entries], entries
+
+        if self._version != self.index.version:
+            entries = list(self.index)
+            self._titles = [e['norm'] for e in entries]
+            self._entries = entries
+            self._version = self.index.version
+        return self._titles, self._entries
+
+    def best(self, titles, entries, query, score_cutoff=0):
+        match = process.extractOne(query, titles, scorer=self.scorer,
+                                   processor=None, score_cutoff=score_cutoff)
+        if not match: return []
+        _, score, idx = match
+        return [(entries[idx], score)]
+
+    def top(self, titles, entries, query, limit=5, score_cutoff=0):
+        if not titles: return []
+        # cdist spreads the comparisons over all cores and releases the GIL
+        scores = process.cdist([query], titles, scorer=self.scorer, processor=None,
+                               score_cutoff=score_cutoff, workers=-1)[0]
+        limit = min(limit, len(scores))
+        idx = np.argpartition(scores, -limit)[-limit:]
+        idx = idx[np.argsort(scores[idx])[::-1]]
+        return [(entries[i], float(scores[i])) for i in idx if scores[i] > 0]
+
+    async def search(self, query, limit=5, score_cutoff=0):
+        """Returns up to `limit` (entry, score) pairs, best first. Runs off the event loop."""
+        query = normalize_title(query)
+        if not query: return []
+        await self.index.build_grams()  # no-op unless a snapshot load is still building them
+        titles, entries = self.refresh(query)
+        if limit == 1:
+            return await asyncio.to_thread(self.best, titles, entries, query, score_cutoff)
+        return await asyncio.to_thread(self.top, titles, entries, query, limit, score_cutoff)
+
+    def suggest(self, query, limit=25):
+        """
+        Cheap synchronous lookup for autocomplete: folder and title prefixes first,
+        then the best trigram candidates. Never touches the full library. Folders only
+        while a snapshot load is still building the title trigrams in the background.
+        """
+        query = normalize_title(query)
+        if not query: return [], []
+        folders = self.index.folder_grams.prefix(query, limit)
+        if self.index.grams.deferred:
+            return folders, []  # building them here would stall the loop for a second or more
+        entries = self.index.prefix(query, limit)
+        if len(entries) < limit and len(query) >= 3:
+            seen = {e['path'] for e in entries}
+            candidates = [e for e in self.index.candidates(query, self.candidate_limit) if e['path'] not in seen]
+            ranked = process.extract(query, [e['norm'] for e in candidates], scorer=fuzz.WRatio,
+                                     processor=None, limit=limit - len(entries))
+            entries += [candidates[idx] for _, _, idx in ranked]
+        return folders, entries
@@ -0,0 +1,55 @@
+import os
+
+
+class SinglesCache:
+    """
+    Keeps the Singles folder (one-off downloads) under a byte and file-count budget
+    by deleting the least recently played files. Only that folder is ever touched,
+    curated playlist folders are never evicted. Files that were never played count
+    from their download time.
+    """
+
+    def __init__(self, index, folder, max_bytes=None, max_files=None):
+        self.index = index
+        self.folder = os.path.relpath(folder, index.root)  # index folder key, e.g. 'Singles'
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+    def plan(self, protected=()):
+        """Entries to delete to get back under budget, least recently played first."""
+        entries = self.index.folder(self.folder)
+        total = sum(e['size'] or 0 for e in entries)
+        count = len(entries)
+        if not self.over(total, count):
+            return []
+
+        last_played = self.index.last_played
+        entries.sort(key=lambda e: last_played.get(e['path'], e['mtime']))
+        victims = []
+        for entry in entries:
+            if not self.over(total, count):
+                break
+            if entry['path'] in protected:
+                continue  # playing or queued right now
+            victims.append(entry)
+            total -= entry['size'] or 0
+            count -= 1
+        return victims
+
+    def over(self, total, count):
+        return ((self.max_bytes is not None and total > self.max_bytes) or
+                (self.max_files is not None and count > self.max_files))
+
+    @staticmethod
+    def delete(paths):
+        """Removes the files (blocking, run it in a thread). Returns the paths actually gone."""
+        gone = []
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # e.g. still open by ffmpeg on Windows, retried on the next pass
+            gone.append(path)
+        return gone
@@ -0,0 +1,125 @@
+import random
+
+
+class Track:
+    """One queued song. Library tracks share the index entry's path/title strings instead of copying them."""
+    __slots__ = ('path', 'title', 'vid')
+
+    def __init__(self, path, title, vid=None):
+        self.path = path    # library file, or a stream URL for songs still downloading
+        self.title = title
+        self.vid = vid      # YouTube id, set for streamed songs so they can be found again after a restart
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry['path'], entry['title'], entry['id'])
+
+    def __repr__(self):
+        return f"Track({self.title!r})"
+
+
+class TrackQueue:
+    """
+    A guild's play queue: a flat list plus a head offset, so popping the next
+    song is O(1) and any position is an O(1) lookup (a deque is O(n) in the middle).
+    Shuffle, remove and move work in place on the list, no copies.
+    `on_change(op, *args)` is told about every mutation (used by the queue journal).
+    """
+
+    def __init__(self, tracks=(), on_change=None):
+        self._items = list(tracks)
+        self._head = 0  # index of the first live track; popped slots are compacted lazily
+        self.on_change = on_change
+
+    def _changed(self, op, *args):
+        if self.on_change: self.on_change(op, *args)
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        return (self._items[i] for i in range(self._head, len(self._items)))
+
+    def __getitem__(self, i):
+        return self._items[self._pos(i)]
+
+    def _pos(self, i):
+        n = len(self)
+        if i < 0: i += n
+        if not 0 <= i < n:
+            raise IndexError("queue index out of range")
+        return self._head + i
+
+    def append(self, track):
+        self._items.append(track)
+        self._changed('add', [track])
+
+    def extend(self, tracks):
+        start = len(self._items)
+        self._items.extend(tracks)
+        if len(self._items) > start: self._changed('add', self._items[start:])
+
+    def popleft(self):
+        if not self:
+            raise IndexError("pop from an empty queue")
+        track = self._items[self._head]
+        self._items[self._head] = None
+        self._head += 1
+        # Drop the dead prefix once it is most of the list (amortized O(1))
+        if self._head > 32 and self._head * 2 > len(self._items):
+            del self._items[:self._head]
+            self._head = 0
+        self._changed('pop')
+        return track
+
+    def clear(self):
+        self._items.clear()
+        self._head = 0
+        self._changed('clear')
+
+    def shuffle(self):
+        """Fisher-Yates over the live part of the list, in place."""
+        items, head = self._items, self._head
+        for i in range(len(items) - 1, head, -1):
+            j = random.randint(head, i)
+            items[i], items[j] = items[j], items[i]
+        self._changed('reset', list(self))
+
+    def remove(self, i):
+        """Removes and returns the track at position i (0 = up next)."""
+        pos = self._pos(i)
+        track = self._items.pop(pos)
+        self._changed('del', pos - self._head)
+        return track
+
+    def move(self, src, dst=0):
+        """Moves the track at position src to position dst (default: up next)."""
+        pos = self._pos(src)
+        track = self._items.pop(pos)
+        dst = min(max(dst, 0), len(self))
+        self._items.insert(self._head + dst, track)
+        self._changed('move', pos - self._head, dst)
+        return track
+
+    def dedupe(self):
+        """Drops repeated songs (same path), keeping the first. Returns how many were removed."""
+        seen, kept = set(), []
+        for track in self:
+            if track.path not in seen:
+                seen.add(track.path)
+                kept.append(track)
+        removed = len(self) - len(kept)
+        self._items, self._head = kept, 0
+        if removed: self._changed('reset', kept)
+        return removed
+
+    def page(self, number, size=15):
+        """The tracks of one page, sliced directly (the rest of the queue isn't touched)."""
+        start = self._head + number * size
+        return self._items[start:min(start + size, len(self._items))]
+
+    def page_count(self, size=15):
+        return max((len(self) - 1) // size + 1, 1)